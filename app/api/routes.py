@@ -1,67 +1,402 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, status
-from fastapi.responses import JSONResponse
-from app.models.pydantic_model import ImageRequest  
-from app.services.ml import StableDiffusionModel  
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Header, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Optional
+from pydantic import ValidationError
+from app.models.pydantic_model import ImageRequest, RefineRequest, CaptionRender
+from app.services.ml import StableDiffusionModel, denoising_steps  
 from app.services.ml import ImageCaptioningPipeline  
 from app.utils.bounding_box_drawer import BoundingBoxDrawer  
 from app.utils.image_processor import ImageProcessor
 from app.utils.app_logger import logger
+from app.utils.cancellation import CancellationToken, LatencyEstimator, RequestCancelledError, resolve_budget_ms, watch_disconnect
 from PIL import Image
 from app.config.stable_diffusion_config import StableDiffusionConfig
 from app.config.image_captioning_config import ImageCaptioningConfig
 from app.config.image_config import UploadImageFileConfig
 from app.config.image_config import ImageFileValidation
-import io, torch
+from app.config.cancellation_config import CancellationConfig
+from app.config.admission_config import AdmissionConfig
+from app.config.bulk_generation_config import BulkGenerationConfig
+from app.config.encoding_config import EncodingConfig
+from app.utils.image_encoder import ImageEncoder
+from app.config.latent_store_config import LatentStoreConfig
+from app.services.latent_store import LatentStore
+from app.config.model_residency_config import ModelResidencyConfig
+from app.services.model_residency import ModelResidencyManager
+from app.services.admission import AdmissionController, QueueFullError, QueueTimeoutError, RateLimitedError, UnknownClientError, BULK
+from app.services.bulk_generation import BulkRequestError, group_into_batches, read_ndjson_items, resolve_output_dir
+import asyncio, io, json, math, os, time, torch
 
 # Initialize configurations
 upload_image_file_config = UploadImageFileConfig()
 image_file_validator = ImageFileValidation(upload_image_file_config)
 stable_diffusion_config = StableDiffusionConfig()
 image_captioning_config = ImageCaptioningConfig()
+cancellation_config = CancellationConfig()
+latency_estimator = LatencyEstimator(
+    cancellation_config.latency_ewma_alpha, cancellation_config.min_latency_samples, cancellation_config.refusal_probe_interval
+)
+admission_config = AdmissionConfig()
+admission_controller = AdmissionController(admission_config)
+bulk_generation_config = BulkGenerationConfig()
+encoding_config = EncodingConfig()
+image_encoder = ImageEncoder(encoding_config)
+latent_store_config = LatentStoreConfig()
+latent_store = LatentStore(latent_store_config)
+model_residency_config = ModelResidencyConfig()
+
+def create_model_residency():
+    """Register the models with a new residency manager; they load on first use."""
+    manager = ModelResidencyManager(model_residency_config)
+    manager.register("stable_diffusion", lambda: StableDiffusionModel(stable_diffusion_config))
+    manager.register("image_captioning", lambda: ImageCaptioningPipeline(image_captioning_config))
+    return manager
+
+model_residency = create_model_residency()
+
+# Non-standard status (nginx convention) for requests abandoned by the client
+HTTP_499_CLIENT_CLOSED_REQUEST = 499
 
 router = APIRouter()
 
-@router.post("/generate")
-async def generate_image(request : ImageRequest):
-    logger.info(f"Received request to process image with prompt: {request.prompt}")
+def refuse_if_deadline_unreachable(operation: str, cancellation_token: CancellationToken, steps: int = 0):
+    # Refuse up front instead of burning compute on a response nobody will wait for
+    if latency_estimator.will_miss(operation, cancellation_token, steps):
+        predicted = latency_estimator.predict(operation, steps)
+        logger.info(f"Refusing {operation} request: predicted {predicted:.2f}s exceeds deadline")
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Request cannot complete within its deadline (predicted {predicted:.2f}s)"
+        )
+
+def cancellation_to_http_exception(error: RequestCancelledError):
+    if error.reason == CancellationToken.DEADLINE_EXCEEDED:
+        return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Request deadline exceeded")
+    return HTTPException(status_code=HTTP_499_CLIENT_CLOSED_REQUEST, detail="Client closed request")
+
+def identify_client(http_request: Request):
+    """Resolve the API client and the priority class its request is scheduled in."""
+    try:
+        client = admission_controller.identify(
+            http_request.headers.get(admission_config.api_key_header),
+            http_request.client.host if http_request.client else None
+        )
+        priority_class = admission_controller.resolve_priority(client, http_request.headers.get(admission_config.priority_header))
+    except UnknownClientError as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return client, priority_class
+
+async def run_cancellable(http_request: Request, cancellation_token: CancellationToken, func, *args):
+    """
+    Wait for a model slot from the admission controller, then run blocking inference in the
+    thread pool while watching the client connection for disconnects.
+    """
+    client, priority_class = identify_client(http_request)
+    watcher = asyncio.create_task(
+        watch_disconnect(http_request, cancellation_token, cancellation_config.disconnect_poll_interval_s)
+    )
+    try:
+        async with admission_controller.admit(client, priority_class, timeout=cancellation_token.remaining()):
+            # The client may have gone away while queued
+            cancellation_token.raise_if_cancelled()
+            return await run_in_threadpool(func, *args)
+    except RateLimitedError as e:
+        logger.info(f"Rate limited client '{client.client_id}'")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except QueueTimeoutError:
+        raise RequestCancelledError(CancellationToken.DEADLINE_EXCEEDED)
+    finally:
+        watcher.cancel()
+
+def run_generation(prompt: str, cancellation_token: CancellationToken, strength: float = 1.0, init_latents=None, init_image=None):
+    """Returns the image, its final latents and the seconds spent in the denoising loop."""
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    timings = {}
+    with model_residency.use("stable_diffusion") as stable_diffusion_model, \
+            torch.cuda.amp.autocast() if device == "cuda" else torch.no_grad():
+        if init_image is not None:
+            init_latents = stable_diffusion_model.pil_to_latents(init_image)
+        latents = stable_diffusion_model.generate_latents([prompt], cancellation_token, init_latents, strength, timings)
+        image = stable_diffusion_model.latents_to_pil(latents)[0]
+    return image, latents, timings["denoise_s"]
+
+def run_batch_generation(prompts, cancellation_token: CancellationToken):
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    with model_residency.use("stable_diffusion") as stable_diffusion_model, \
+            torch.cuda.amp.autocast() if device == "cuda" else torch.no_grad():
+        return stable_diffusion_model.generate_images(prompts, cancellation_token)
+
+def encoding_options(request: ImageRequest):
+    return {"quality": request.quality, "progressive": request.progressive, "optimize": request.optimize}
+
+def encoded_image_fields(request: ImageRequest, encoded: dict):
+    """Response fields for encoded renditions: `image_data` by default, a `renditions` map when requested."""
+    if not request.renditions:
+        return {"image_data": ImageProcessor.bytes_to_base64(encoded["full"][0])}
+    return {"renditions": {
+        name: {"image_data": ImageProcessor.bytes_to_base64(data), "width": width, "height": height}
+        for name, (data, (width, height)) in encoded.items()
+    }}
+
+def finish_bulk_item(index: int, request: ImageRequest, image: Image.Image, output_path: Optional[str]):
+    """Transform and encode one generated image into its NDJSON result line."""
+    image = ImageProcessor.apply_transformations(image, request.transformations or [])
+    image_format = request.format or encoding_config.default_format
+    encoded = image_encoder.encode_renditions(image, image_format, request.renditions or ["full"], **encoding_options(request))
+    result = {"index": index, "status": "success", "image_format": image_format}
+    if output_path is None:
+        result.update(encoded_image_fields(request, encoded))
+        return result
+
+    paths = {}
+    for name, (data, _) in encoded.items():
+        suffix = "" if name == "full" else f"_{name}"
+        paths[name] = os.path.join(output_path, f"{index:06d}{suffix}.{image_format.lower()}")
+        with open(paths[name], "wb") as output_file:
+            output_file.write(data)
+    if request.renditions:
+        result["paths"] = paths
+    else:
+        result["path"] = paths["full"]
+    return result
+
+def ndjson_line(result: dict) -> bytes:
+    return (json.dumps(result) + "\n").encode("utf-8")
+
+def run_captioning(image: Image.Image, cancellation_token: CancellationToken):
+    with model_residency.use("image_captioning") as image_caption:
+        return image_caption.generate_caption_bbox(image, cancellation_token=cancellation_token)
+
+async def respond_with_generation(request: ImageRequest, http_request: Request, header_deadline_ms: Optional[int],
+                                  strength: float = 1.0, init_latents=None, init_image=None):
+    """
+    Generate an image (or refine initial latents / an initial image), then transform and encode it.
+    The final latents are kept in the latent store under the returned generation ID.
+    """
+    try:
+        image_encoder.check_renditions(request.renditions or [])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    cancellation_token = CancellationToken.from_budget_ms(resolve_budget_ms(request.deadline_ms, header_deadline_ms))
+    # Refinements (which may also VAE-encode an upload) keep their own estimate of fixed and per-step cost
+    if init_latents is None and init_image is None:
+        operation, steps = "generate", stable_diffusion_config.num_inference_steps
+    else:
+        operation, steps = "refine", denoising_steps(stable_diffusion_config.num_inference_steps, strength)
+    refuse_if_deadline_unreachable(operation, cancellation_token, steps)
 
     # Generate image from prompt
     # Load and Generate Image from Prompt
     try:
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        stable_diffusion_model = StableDiffusionModel(stable_diffusion_config)
-        with torch.cuda.amp.autocast() if device == "cuda" else torch.no_grad():
-            image = stable_diffusion_model.generate_image(request.prompt)
+        started = time.monotonic()
+        image, latents, denoise_s = await run_cancellable(
+            http_request, cancellation_token, run_generation, request.prompt, cancellation_token, strength, init_latents, init_image
+        )
+        latency_estimator.observe(operation, time.monotonic() - started, steps, denoise_s)
+        generation_id = latent_store.put(latents)
         logger.info("Image generated successfully from prompt")
+    except RequestCancelledError as e:
+        raise cancellation_to_http_exception(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating image from prompt: {str(e)}")
         raise HTTPException(status_code=500, detail="Image generation failed")
 
     # Apply Transformations
     try:
-        transformationList = request.transformations
+        cancellation_token.raise_if_cancelled()
+        transformationList = request.transformations or []
         image = ImageProcessor.apply_transformations(image, transformationList)
         width, height = image.size
         logger.info(f"Final image size after transformations: {width}x{height}")
+    except RequestCancelledError as e:
+        raise cancellation_to_http_exception(e)
     except Exception as e:
         logger.error(f"Error applying transformations: {str(e)}")
         raise HTTPException(status_code=500, detail="Image transformation failed")
 
-    # Convert Image to Base64 for Transmission
+    # Encode the requested renditions off the event loop for transmission
     try:
-        image_format = request.format.upper()
-        base64_image = ImageProcessor.convert_to_base64(image, image_format)
+        cancellation_token.raise_if_cancelled()
+        image_format = request.format or encoding_config.default_format
+        encoded = await image_encoder.encode_renditions_async(
+            image, image_format, request.renditions or ["full"], **encoding_options(request)
+        )
         logger.info("Image processing complete")
+    except RequestCancelledError as e:
+        raise cancellation_to_http_exception(e)
     except Exception as e:
         logger.error(f"Error encoding image to Base64: {str(e)}")
         raise HTTPException(status_code=500, detail="Image encoding failed")
 
     # Return Base64 Image Data
-    return {"status": "success", "image_data": base64_image,"image_format":image_format}
+    return {"status": "success", "generation_id": generation_id, **encoded_image_fields(request, encoded), "image_format": image_format}
+
+@router.post("/generate")
+async def generate_image(
+    request : ImageRequest,
+    http_request: Request,
+    header_deadline_ms: Optional[int] = Header(None, alias=cancellation_config.deadline_header, gt=0)
+):
+    logger.info(f"Received request to process image with prompt: {request.prompt}")
+    return await respond_with_generation(request, http_request, header_deadline_ms)
+
+# Endpoint to refine an earlier generation with a new prompt, re-running only part of the schedule
+@router.post("/generate/refine")
+async def refine_image(
+    request: RefineRequest,
+    http_request: Request,
+    header_deadline_ms: Optional[int] = Header(None, alias=cancellation_config.deadline_header, gt=0)
+):
+    logger.info(f"Received request to refine generation {request.generation_id} with prompt: {request.prompt}")
+    init_latents = latent_store.get(request.generation_id)
+    if init_latents is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown or expired generation ID")
+    strength = request.strength or latent_store_config.default_strength
+    return await respond_with_generation(request, http_request, header_deadline_ms, strength, init_latents=init_latents)
+
+# Endpoint to refine an uploaded image, encoded to latents with the Stable Diffusion VAE
+@router.post("/generate/refine/upload")
+async def refine_uploaded_image(
+    http_request: Request,
+    file: UploadFile = File(...),
+    prompt: str = Form(...),
+    strength: float = Form(latent_store_config.default_strength, gt=0, le=1),
+    format: Optional[str] = Form(None),
+    header_deadline_ms: Optional[int] = Header(None, alias=cancellation_config.deadline_header, gt=0)
+):
+    try:
+        request = ImageRequest(prompt=prompt, format=format)
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    logger.info(f"Received request to refine an uploaded image with prompt: {request.prompt}")
+
+    # Validate image format and size
+    image_file_validator.validate_image_format(file)
+    image_file_validator.validate_image_size(file)
+
+    # Read and open the uploaded image
+    try:
+        image_data = await file.read()
+        image = Image.open(io.BytesIO(image_data))
+        image.load()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to read image: {str(e)}"
+        )
+
+    return await respond_with_generation(request, http_request, header_deadline_ms, strength, init_image=image)
+
+def render_annotations(image: Image.Image, bboxes, labels, render: CaptionRender):
+    """Render detected boxes in the requested mode; returns the extra response fields."""
+    if render == CaptionRender.none:
+        return {}
+    drawer = BoundingBoxDrawer(image, bboxes, labels, image_captioning_config.label_font_size)
+    if render == CaptionRender.svg:
+        return {"svg": drawer.to_svg()}
+    if render == CaptionRender.overlay:
+        overlay, scale = drawer.draw_overlay(image_captioning_config.overlay_max_side)
+        return {"overlay_data": ImageProcessor.convert_to_base64(overlay, "PNG"), "overlay_scale": scale}
+
+    # Draw bounding boxes on the image
+    drawer.draw_boxes()
+
+    # Convert image to Base64 format
+    return {"image_data": ImageProcessor.convert_to_base64(drawer.image, "JPEG")}
+
+# Endpoint to generate many images from an NDJSON stream of ImageRequest objects
+@router.post("/generate/bulk")
+async def generate_images_bulk(
+    http_request: Request,
+    start_index: int = Query(0, ge=0),
+    output_dir: Optional[str] = Query(None),
+    header_deadline_ms: Optional[int] = Header(None, alias=cancellation_config.deadline_header, gt=0)
+):
+    # Bulk work always runs in the bulk priority class. Each batch waits for one rate-limit token per item
+    # before it is admitted, so large requests are paced by the client's rate rather than refused
+    client, _ = identify_client(http_request)
+    try:
+        output_path = resolve_output_dir(bulk_generation_config.output_root, output_dir) if output_dir else None
+        items, errors = await read_ndjson_items(http_request.stream(), start_index, bulk_generation_config.max_items)
+    except BulkRequestError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    valid_items = []
+    for index, request in items:
+        try:
+            image_encoder.check_renditions(request.renditions or [])
+            valid_items.append((index, request))
+        except ValueError as e:
+            errors.append((index, str(e)))
+    items = valid_items
+    batches = group_into_batches(items, bulk_generation_config.max_batch_size)
+    logger.info(f"Received bulk request from '{client.client_id}' with {len(items)} items in {len(batches)} batches")
+
+    async def stream_results():
+        cancellation_token = CancellationToken.from_budget_ms(header_deadline_ms)
+        completed = False
+        try:
+            for index, detail in errors:
+                yield ndjson_line({"index": index, "status": "error", "detail": detail})
+
+            for position, batch in enumerate(batches):
+                try:
+                    cancellation_token.raise_if_cancelled()
+                    await admission_controller.acquire(client, len(batch), timeout=cancellation_token.remaining())
+                    async with admission_controller.admit(client, BULK, cost=len(batch),
+                                                          timeout=cancellation_token.remaining(), rate_limited=False):
+                        images = await run_in_threadpool(
+                            run_batch_generation, [request.prompt for _, request in batch], cancellation_token
+                        )
+                except (RequestCancelledError, QueueTimeoutError, QueueFullError) as e:
+                    # Report every item that will not be produced so the client knows where to resume
+                    for remaining in batches[position:]:
+                        for index, _ in remaining:
+                            yield ndjson_line({"index": index, "status": "error", "detail": str(e)})
+                    break
+                except Exception as e:
+                    logger.error(f"Error generating bulk batch: {str(e)}")
+                    for index, _ in batch:
+                        yield ndjson_line({"index": index, "status": "error", "detail": "Image generation failed"})
+                    continue
+
+                for (index, request), image in zip(batch, images):
+                    try:
+                        result = await run_in_threadpool(finish_bulk_item, index, request, image, output_path)
+                    except Exception as e:
+                        logger.error(f"Error post-processing bulk item {index}: {str(e)}")
+                        result = {"index": index, "status": "error", "detail": "Image transformation or encoding failed"}
+                    yield ndjson_line(result)
+            completed = True
+        finally:
+            # The response was abandoned mid-stream: stop any batch still running in the thread pool
+            if not completed:
+                cancellation_token.cancel(CancellationToken.DISCONNECTED)
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 # Endpoint to caption an uploaded image
 @router.post("/caption")
-async def caption_image(file: UploadFile = File(...)):
+async def caption_image(
+    http_request: Request,
+    file: UploadFile = File(...),
+    render: CaptionRender = Query(CaptionRender.burned),
+    deadline_ms: Optional[int] = Query(None, gt=0),
+    header_deadline_ms: Optional[int] = Header(None, alias=cancellation_config.deadline_header, gt=0)
+):
+    cancellation_token = CancellationToken.from_budget_ms(resolve_budget_ms(deadline_ms, header_deadline_ms))
+    refuse_if_deadline_unreachable("caption", cancellation_token)
+
     # Validate image format and size
     image_file_validator.validate_image_format(file)
     image_file_validator.validate_image_size(file)
@@ -78,32 +413,45 @@ async def caption_image(file: UploadFile = File(...)):
 
     # Generate caption and process bounding boxes
     try:
-        image_caption = ImageCaptioningPipeline(image_captioning_config)
-        caption_data = image_caption.generate_caption_bbox(image)["<OD>"]
+        started = time.monotonic()
+        caption_data = (await run_cancellable(http_request, cancellation_token, run_captioning, image, cancellation_token))["<OD>"]
+        latency_estimator.observe("caption", time.monotonic() - started)
         print("type caption_data",type(caption_data))
         print("caption_data",caption_data)
         if not caption_data:
             raise ValueError("Caption data or object detection results not found in parsed answer.")
-        
+
         # Extract bounding boxes and labels
         bboxes, labels = caption_data['bboxes'], caption_data['labels']
         answer = ', '.join(labels)
 
-        # Draw bounding boxes on the image
-        drawer = BoundingBoxDrawer(image, bboxes, labels)
-        drawer.draw_boxes()
+        # Render the boxes off the event loop; only the burned mode re-encodes the full image
+        cancellation_token.raise_if_cancelled()
+        annotation = await run_in_threadpool(render_annotations, image, bboxes, labels, render)
 
-        # Convert image to Base64 format
-        base64_image = ImageProcessor.convert_to_base64(drawer.image, "JPEG")
-        
+    except RequestCancelledError as e:
+        raise cancellation_to_http_exception(e)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to generate caption: {str(e)}"
         )
 
-    # Return the caption and encoded image as a response
-    return JSONResponse(content={"caption": answer, "image_data": base64_image})
+    # Return the caption, the structured detections and the requested rendering
+    return JSONResponse(content={"caption": answer, "bboxes": bboxes, "labels": labels, **annotation})
+
+# Per-priority-class queue-wait metrics from the admission layer
+@router.get("/admission/stats")
+async def admission_stats():
+    return JSONResponse(content=admission_controller.stats())
+
+# Which models are loaded and how much of the memory budget they use
+@router.get("/models/residency")
+async def model_residency_stats():
+    return JSONResponse(content=model_residency.stats())
+
 # Health check endpoint to verify that the service is running
 @router.get("/health")
 async def health_check():
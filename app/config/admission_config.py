@@ -0,0 +1,33 @@
+from typing import Dict
+from pydantic import BaseModel
+from pydantic_settings import BaseSettings
+
+
+class ClientPolicy(BaseModel):
+    """Scheduling weight and rate limit for one API client."""
+    client_id: str
+    weight: float = 1.0           # Share of model time relative to other clients in the same priority class
+    rate_per_s: float = 1.0       # Token bucket refill rate (requests per second)
+    burst: int = 5                # Token bucket capacity
+    allow_interactive: bool = True
+
+
+class AdmissionConfig(BaseSettings):
+    """
+    Admission control settings loaded from environment variables prefixed with ADMISSION_,
+    e.g. ADMISSION_API_KEYS='{"key-a": {"client_id": "team-a", "weight": 2}}'.
+    """
+    api_keys: Dict[str, ClientPolicy] = {}
+    require_api_key: bool = False
+    anonymous_policy: ClientPolicy = ClientPolicy(client_id="anonymous", rate_per_s=0.5, burst=3)
+    api_key_header: str = "X-API-Key"
+    priority_header: str = "X-Priority"
+    max_concurrency: int = 1      # Requests allowed on the models at the same time
+    max_queue_size: int = 256
+    wait_stats_window: int = 1024  # Number of recent queue waits kept per priority class
+    queue_wait_slo_s: Dict[str, float] = {"interactive": 2.0, "bulk": 120.0}
+
+    class Config:
+        env_prefix = "ADMISSION_"
+        env_file = ".env"
+        extra = "ignore"
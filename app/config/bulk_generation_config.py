@@ -0,0 +1,14 @@
+class BulkGenerationConfig:
+    def __init__(
+        self,
+        max_batch_size: int = 4,
+        max_items: int = 10000,
+        output_root: str = "bulk_outputs"
+    ):
+        assert max_batch_size > 0, "Max batch size must be positive"
+        assert max_items > 0, "Max number of items must be positive"
+
+        self.max_batch_size = max_batch_size
+        self.max_items = max_items
+        # Requests may only write outputs to directories below this root
+        self.output_root = output_root
@@ -0,0 +1,21 @@
+class CancellationConfig:
+    def __init__(
+        self,
+        deadline_header: str = "X-Request-Deadline",
+        disconnect_poll_interval_s: float = 0.25,
+        latency_ewma_alpha: float = 0.2,
+        min_latency_samples: int = 3,
+        refusal_probe_interval: int = 10
+    ):
+        assert disconnect_poll_interval_s > 0, "Disconnect poll interval must be positive"
+        assert 0 < latency_ewma_alpha <= 1, "EWMA alpha must be in (0, 1]"
+        assert min_latency_samples > 0, "Minimum number of latency samples must be positive"
+        assert refusal_probe_interval > 0, "Refusal probe interval must be positive"
+
+        self.deadline_header = deadline_header
+        self.disconnect_poll_interval_s = disconnect_poll_interval_s
+        self.latency_ewma_alpha = latency_ewma_alpha
+        # Requests are only refused for missing their deadline once this many have completed
+        self.min_latency_samples = min_latency_samples
+        # Every Nth request predicted to miss its deadline runs anyway to re-measure latency
+        self.refusal_probe_interval = refusal_probe_interval
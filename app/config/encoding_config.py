@@ -0,0 +1,21 @@
+from typing import Dict, Optional
+
+# Longest side in pixels for each named rendition; None keeps the source size
+DEFAULT_RENDITION_SIZES = {"thumbnail": 128, "medium": 512, "full": None}
+
+
+class EncodingConfig:
+    def __init__(
+        self,
+        default_format: str = "PNG",
+        rendition_sizes: Optional[Dict[str, Optional[int]]] = None,
+        max_workers: int = 4
+    ):
+        rendition_sizes = rendition_sizes if rendition_sizes is not None else dict(DEFAULT_RENDITION_SIZES)
+        assert max_workers > 0, "Number of encoding workers must be positive"
+        # Responses without explicit renditions return the "full" rendition
+        assert "full" in rendition_sizes, "Rendition sizes must include 'full'"
+
+        self.default_format = default_format
+        self.rendition_sizes = rendition_sizes
+        self.max_workers = max_workers
@@ -6,11 +6,18 @@ class ImageCaptioningConfig:
         processor: str = "microsoft/Florence-2-large",
         max_new_tokens: int = 1024,
         do_sample:bool = False ,
-        num_beams: int = 3
+        num_beams: int = 3,
+        label_font_size: int = 16,
+        overlay_max_side: int = 512
     ):
+        assert overlay_max_side > 0, "Overlay size must be positive"
+
         self.model_name = model_name
         self.caption_model = caption_model
         self.processor = processor
         self.max_new_tokens = max_new_tokens
         self.do_sample = do_sample
         self.num_beams = num_beams
+        self.label_font_size = label_font_size
+        # Longest side of the transparent overlay returned by render=overlay
+        self.overlay_max_side = overlay_max_side
@@ -0,0 +1,15 @@
+class LatentStoreConfig:
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 256 * 1024 * 1024,
+        default_strength: float = 0.5
+    ):
+        assert max_entries > 0, "Max number of stored latents must be positive"
+        assert max_bytes > 0, "Latent store size must be positive"
+        assert 0 < default_strength <= 1, "Default strength must be in (0, 1]"
+
+        self.max_entries = max_entries
+        # One 1x4x64x64 float32 latent is 64 KiB
+        self.max_bytes = max_bytes
+        self.default_strength = default_strength
@@ -0,0 +1,31 @@
+from typing import Dict, Optional
+
+
+class ModelResidencyConfig:
+    def __init__(
+        self,
+        memory_budget_mb: float = 10240,
+        idle_timeout_s: float = 600,
+        sweep_interval_s: float = 30,
+        traffic_window: int = 100,
+        preload_min_share: float = 0.3,
+        footprint_estimates_mb: Optional[Dict[str, float]] = None
+    ):
+        assert memory_budget_mb > 0, "Memory budget must be positive"
+        assert idle_timeout_s > 0, "Idle timeout must be positive"
+        assert sweep_interval_s > 0, "Sweep interval must be positive"
+        assert 0 < preload_min_share <= 1, "Preload share must be in (0, 1]"
+
+        self.memory_budget_mb = memory_budget_mb
+        # Models unused for this long are unloaded by the background sweep
+        self.idle_timeout_s = idle_timeout_s
+        self.sweep_interval_s = sweep_interval_s
+        # Models requested by at least `preload_min_share` of the last `traffic_window` requests are preloaded;
+        # only requests within the last `idle_timeout_s` count
+        self.traffic_window = traffic_window
+        self.preload_min_share = preload_min_share
+        # Used to make room before a model is loaded; replaced by the measured size once it is resident
+        self.footprint_estimates_mb = footprint_estimates_mb if footprint_estimates_mb is not None else {
+            "stable_diffusion": 4400,
+            "image_captioning": 3100,
+        }
@@ -1,3 +1,8 @@
+from typing import Optional, Union
+
+ATTENTION_PROCESSORS = ("sdpa", "eager")
+
+
 class StableDiffusionConfig:
     def __init__(
         self,
@@ -9,10 +14,21 @@ class StableDiffusionConfig:
         tokenizer_model: str = "openai/clip-vit-large-patch14",
         text_encoder_model: str = "openai/clip-vit-large-patch14",
         unet_model: str = "CompVis/stable-diffusion-v1-4",
-        scheduler_model: str = "CompVis/stable-diffusion-v1-4"
+        scheduler_model: str = "CompVis/stable-diffusion-v1-4",
+        attention_processor: Optional[str] = None,
+        attention_slice_size: Optional[Union[str, int]] = None,
+        token_merge_ratio: float = 0.0,
+        token_merge_min_tokens: int = 4096
     ):
         assert num_inference_steps > 0, "Number of inference steps must be positive"
         assert guidance_scale > 0, "Guidance scale must be positive"
+        assert attention_processor is None or attention_processor in ATTENTION_PROCESSORS, \
+            f"Attention processor must be one of {ATTENTION_PROCESSORS}"
+        assert attention_slice_size is None or attention_slice_size in ("auto", "max") or \
+            (isinstance(attention_slice_size, int) and attention_slice_size > 0), \
+            "Attention slice size must be 'auto', 'max' or a positive integer"
+        assert 0 <= token_merge_ratio < 1, "Token merge ratio must be in [0, 1)"
+        assert token_merge_min_tokens > 0, "Minimum number of tokens to merge must be positive"
 
         self.model_name = model_name
         self.num_inference_steps = num_inference_steps
@@ -23,3 +39,12 @@ class StableDiffusionConfig:
         self.text_encoder_model = text_encoder_model
         self.unet_model = unet_model
         self.scheduler_model = scheduler_model
+        # Opt-in UNet attention acceleration, see app/services/attention_acceleration.py.
+        # None keeps the processor diffusers picks (SDPA on torch 2); "eager" is the explicit matmul baseline
+        self.attention_processor = attention_processor
+        # Compute attention a few heads at a time to bound peak memory; replaces the processor above
+        self.attention_slice_size = attention_slice_size
+        # Fraction of self-attention tokens merged (ToMe); only layers with at least min_tokens tokens,
+        # i.e. the 64x64 latent resolution by default
+        self.token_merge_ratio = token_merge_ratio
+        self.token_merge_min_tokens = token_merge_min_tokens
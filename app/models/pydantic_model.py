@@ -1,5 +1,7 @@
 from pydantic import BaseModel, validator, ValidationError
 from typing import List, Dict, Optional
+from enum import Enum
+from app.utils.image_encoder import ImageEncoder
 
 class Transformation(BaseModel):
     name: str
@@ -63,6 +65,11 @@ class ImageRequest(BaseModel):
     prompt: str
     format: Optional[str] = None
     transformations: Optional[List[Transformation]] = None
+    deadline_ms: Optional[int] = None  # Time budget for the request, measured from arrival
+    quality: Optional[int] = None  # 1-100, used by JPEG, WEBP and AVIF
+    progressive: bool = False
+    optimize: bool = False
+    renditions: Optional[List[str]] = None  # e.g. ["thumbnail", "medium", "full"]
 
     @validator('prompt')
     def validate_prompt(cls, v):
@@ -72,9 +79,52 @@ class ImageRequest(BaseModel):
 
     @validator('format')
     def validate_format(cls, v):
-        allowed_formats = {"PNG", "JPG", "JPEG", "BMP"}
+        if v is None:
+            return v
+        allowed_formats = ImageEncoder.supported_formats() | {"JPG"}
         if v.upper() not in allowed_formats:
             raise ValueError(f"Format '{v}' is not supported. Supported formats: {allowed_formats}") 
         if v.upper() == 'JPG':
             return "JPEG"
         return v.upper()
+
+    @validator('quality')
+    def validate_quality(cls, v):
+        if v is not None and not 1 <= v <= 100:
+            raise ValueError("'quality' must be between 1 and 100.")
+        return v
+
+    @validator('renditions')
+    def validate_renditions(cls, v):
+        if v is not None:
+            if not v:
+                raise ValueError("'renditions' must name at least one rendition.")
+            # Names are checked against the configured rendition sizes by ImageEncoder.check_renditions
+            return list(dict.fromkeys(v))
+        return v
+
+    @validator('deadline_ms')
+    def validate_deadline_ms(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("'deadline_ms' must be a positive number of milliseconds.")
+        return v
+
+
+
+class RefineRequest(ImageRequest):
+    generation_id: str
+    strength: Optional[float] = None  # Fraction of the denoising schedule to re-run; defaults to the server setting
+
+    @validator('strength')
+    def validate_strength(cls, v):
+        if v is not None and not 0 < v <= 1:
+            raise ValueError("'strength' must be greater than 0 and at most 1.")
+        return v
+
+
+class CaptionRender(str, Enum):
+    """How /caption returns the detected boxes."""
+    none = "none"          # Structured bboxes and labels only
+    svg = "svg"            # Vector overlay in the image's coordinate space
+    overlay = "overlay"    # Transparent PNG layer at reduced scale
+    burned = "burned"      # Boxes drawn onto the uploaded image, re-encoded as JPEG
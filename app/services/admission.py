@@ -0,0 +1,273 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from app.config.admission_config import AdmissionConfig, ClientPolicy
+
+# Priority classes in dispatch order: a waiting interactive request is always served before bulk work
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITY_CLASSES = (INTERACTIVE, BULK)
+
+
+class UnknownClientError(Exception):
+    """Raised when an API key is missing or not configured."""
+
+
+class RateLimitedError(Exception):
+    """Raised when a client has exhausted its token bucket."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class QueueFullError(Exception):
+    """Raised when too many requests are already waiting for the models."""
+
+
+class QueueTimeoutError(Exception):
+    """Raised when no model slot became free before the request's timeout."""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, burst: int, clock=time.monotonic):
+        assert rate_per_s > 0, "Token bucket rate must be positive"
+        assert burst > 0, "Token bucket burst must be positive"
+
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def try_consume(self, tokens: float = 1.0) -> float:
+        """
+        Take `tokens` from the bucket if available.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until enough tokens accumulate.
+        """
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0.0
+        return (tokens - self._tokens) / self.rate_per_s
+
+
+class QueueWaitStats:
+    """Rolling window of queue-wait samples for one priority class."""
+
+    def __init__(self, window: int, slo_s: Optional[float] = None):
+        self.samples = deque(maxlen=window)
+        self.slo_s = slo_s
+        self.total = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.total += 1
+
+    @staticmethod
+    def percentile(ordered, fraction):
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    def summary(self) -> Dict[str, object]:
+        ordered = sorted(self.samples)
+        summary = {
+            "count": self.total,
+            "window": len(ordered),
+            "p50_s": self.percentile(ordered, 0.50),
+            "p95_s": self.percentile(ordered, 0.95),
+            "p99_s": self.percentile(ordered, 0.99),
+            "max_s": ordered[-1] if ordered else None,
+        }
+        if self.slo_s is not None:
+            within = sum(1 for sample in ordered if sample <= self.slo_s)
+            summary["slo_s"] = self.slo_s
+            summary["within_slo"] = within / len(ordered) if ordered else None
+        return summary
+
+
+class _Ticket:
+    __slots__ = ("client_id", "priority_class", "start_tag", "future")
+
+    def __init__(self, client_id, priority_class, start_tag, future):
+        self.client_id = client_id
+        self.priority_class = priority_class
+        self.start_tag = start_tag
+        self.future = future
+
+
+class AdmissionController:
+    """
+    Admission layer in front of the models.
+
+    Requests are rate limited per client with a token bucket, then wait for one of
+    `max_concurrency` model slots. Waiting requests are ordered by priority class first and,
+    within a class, by weighted fair queuing (start-time fair queuing on per-client virtual
+    finish tags), so a client flooding the service only delays its own requests.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, config: AdmissionConfig, clock=time.monotonic):
+        assert config.max_concurrency > 0, "Max concurrency must be positive"
+
+        self.config = config
+        self._clock = clock
+        self._in_flight = 0
+        self._queued = 0
+        self._sequence = itertools.count()
+        self._queues = {priority_class: [] for priority_class in PRIORITY_CLASSES}
+        self._virtual_time = {priority_class: 0.0 for priority_class in PRIORITY_CLASSES}
+        self._last_finish_tag = {}
+        self._buckets = {}
+        self._wait_stats = {
+            priority_class: QueueWaitStats(config.wait_stats_window, config.queue_wait_slo_s.get(priority_class))
+            for priority_class in PRIORITY_CLASSES
+        }
+
+    def identify(self, api_key: Optional[str], client_host: Optional[str]) -> ClientPolicy:
+        """Resolve the calling client from its API key; keyless callers are identified by host if allowed."""
+        if api_key is not None and api_key in self.config.api_keys:
+            return self.config.api_keys[api_key]
+        if api_key is not None or self.config.require_api_key:
+            raise UnknownClientError("Missing or invalid API key")
+        return self.config.anonymous_policy.model_copy(
+            update={"client_id": f"{self.config.anonymous_policy.client_id}:{client_host or 'unknown'}"}
+        )
+
+    def resolve_priority(self, client: ClientPolicy, requested: Optional[str]) -> str:
+        priority_class = (requested or INTERACTIVE).lower()
+        if priority_class not in PRIORITY_CLASSES:
+            raise ValueError(f"Priority '{requested}' is not supported. Supported priorities: {PRIORITY_CLASSES}")
+        if priority_class == INTERACTIVE and not client.allow_interactive:
+            return BULK
+        return priority_class
+
+    def consume(self, client: ClientPolicy, tokens: float = 1.0):
+        """Take `tokens` from the client's token bucket, raising RateLimitedError if it is empty."""
+        bucket = self._buckets.get(client.client_id)
+        if bucket is None:
+            bucket = self._buckets[client.client_id] = TokenBucket(client.rate_per_s, client.burst, self._clock)
+        retry_after = bucket.try_consume(tokens)
+        if retry_after > 0:
+            raise RateLimitedError(retry_after)
+
+    async def acquire(self, client: ClientPolicy, tokens: float, timeout: Optional[float] = None):
+        """
+        Take `tokens` from the client's token bucket, waiting for it to refill as needed.
+
+        Tokens are taken at most a burst at a time, so work larger than the client's burst is paced
+        by its refill rate rather than refused.
+
+        Raises:
+            QueueTimeoutError: The tokens will not be available within `timeout` seconds.
+        """
+        deadline = None if timeout is None else self._clock() + timeout
+        while tokens > 0:
+            chunk = min(tokens, client.burst)
+            try:
+                self.consume(client, chunk)
+            except RateLimitedError as e:
+                if deadline is not None and self._clock() + e.retry_after > deadline:
+                    raise QueueTimeoutError(f"Rate limit leaves no time before the deadline (retry after {e.retry_after:.2f}s)")
+                await asyncio.sleep(e.retry_after)
+                continue
+            tokens -= chunk
+
+    @asynccontextmanager
+    async def admit(self, client: ClientPolicy, priority_class: str, cost: float = 1.0,
+                    timeout: Optional[float] = None, rate_limited: bool = True):
+        """
+        Hold a model slot for the duration of the `async with` block.
+
+        Parameters:
+            cost (float): Model time the request will use, in single-image units; scales the fair-queuing tag.
+            timeout (float, optional): Seconds to wait for a slot before giving up.
+            rate_limited (bool): Whether to take a token from the client's bucket. Bulk batches take their
+                                 tokens with `acquire` before being admitted.
+
+        Raises:
+            RateLimitedError: The client's token bucket is empty.
+            QueueFullError: The wait queue is at capacity.
+            QueueTimeoutError: No slot became free within `timeout` seconds.
+        """
+        if rate_limited:
+            self.consume(client)
+        can_start = self._in_flight < self.config.max_concurrency and self._queued == 0
+        if not can_start and self._queued >= self.config.max_queue_size:
+            raise QueueFullError("Too many requests are waiting for the models")
+
+        # Every admitted request advances its client's finish tag, including ones that skip the queue
+        key = (priority_class, client.client_id)
+        start_tag = max(self._virtual_time[priority_class], self._last_finish_tag.get(key, 0.0))
+        self._last_finish_tag[key] = start_tag + cost / client.weight
+
+        enqueued_at = self._clock()
+        if can_start:
+            self._in_flight += 1
+            self._virtual_time[priority_class] = start_tag
+        else:
+            await self._wait_for_slot(client, priority_class, start_tag, timeout)
+        self._wait_stats[priority_class].record(self._clock() - enqueued_at)
+
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._dispatch()
+
+    async def _wait_for_slot(self, client, priority_class, start_tag, timeout):
+        finish_tag = self._last_finish_tag[(priority_class, client.client_id)]
+        ticket = _Ticket(client.client_id, priority_class, start_tag, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queues[priority_class], (finish_tag, next(self._sequence), ticket))
+        self._queued += 1
+        try:
+            await asyncio.wait_for(ticket.future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError) as error:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # The slot was handed over just as the waiter gave up; pass it on
+                self._in_flight -= 1
+                self._dispatch()
+            else:
+                ticket.future.cancel()
+                self._queued -= 1
+            if isinstance(error, asyncio.TimeoutError):
+                raise QueueTimeoutError(f"No model slot became free within {timeout:.2f}s") from error
+            raise
+
+    def _dispatch(self):
+        while self._in_flight < self.config.max_concurrency:
+            ticket = self._pop_next()
+            if ticket is None:
+                return
+            self._in_flight += 1
+            self._virtual_time[ticket.priority_class] = ticket.start_tag
+            ticket.future.set_result(None)
+
+    def _pop_next(self):
+        for priority_class in PRIORITY_CLASSES:
+            queue = self._queues[priority_class]
+            while queue:
+                _, _, ticket = heapq.heappop(queue)
+                if ticket.future.cancelled():
+                    continue  # Waiter gave up; already removed from the queued count
+                self._queued -= 1
+                return ticket
+        return None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "in_flight": self._in_flight,
+            "queued": {priority_class: sum(1 for _, _, ticket in queue if not ticket.future.cancelled())
+                       for priority_class, queue in self._queues.items()},
+            "queue_wait": {priority_class: stats.summary() for priority_class, stats in self._wait_stats.items()},
+        }
+
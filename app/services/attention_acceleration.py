@@ -0,0 +1,117 @@
+import math
+from typing import Callable, Tuple
+import torch
+from diffusers.models.attention_processor import AttnProcessor, AttnProcessor2_0
+from app.utils.app_logger import logger
+
+
+def bipartite_soft_matching(metric: torch.Tensor, ratio: float) -> Tuple[Callable, Callable]:
+    """
+    Build ToMe merge/unmerge functions for a square grid of tokens.
+
+    The top-left token of every 2x2 window is a destination and the other three are sources. Each source
+    is matched to its most similar destination, and the `ratio * N` best-matched sources are averaged into
+    their destinations. Unmerging copies each destination back to the sources merged into it.
+
+    Parameters:
+        metric (torch.Tensor): (batch, N, C) tokens used for similarity; N must be a square number.
+        ratio (float): Fraction of all N tokens to remove, capped at the number of sources.
+
+    Returns:
+        (merge, unmerge) functions mapping (batch, N, C) to (batch, N - r, C) and back.
+    """
+    batch_size, num_tokens, _ = metric.shape
+    side = math.isqrt(num_tokens)
+    is_dst = torch.zeros(side, side, dtype=torch.bool, device=metric.device)
+    is_dst[::2, ::2] = True
+    is_dst = is_dst.flatten()
+    dst_positions = is_dst.nonzero().squeeze(1)
+    src_positions = (~is_dst).nonzero().squeeze(1)
+    r = min(int(num_tokens * ratio), len(src_positions))
+
+    with torch.no_grad():
+        metric = metric / metric.norm(dim=-1, keepdim=True)
+        scores = metric[:, src_positions] @ metric[:, dst_positions].transpose(-1, -2)
+        node_max, node_idx = scores.max(dim=-1)
+        edge_idx = node_max.argsort(dim=-1, descending=True)
+        unm_idx = edge_idx[:, r:]                            # Sources kept as they are
+        src_idx = edge_idx[:, :r]                            # Sources merged away
+        dst_idx = node_idx.gather(-1, src_idx)               # Destination each merged source goes to
+
+    def merge(x: torch.Tensor) -> torch.Tensor:
+        channels = x.shape[-1]
+        src, dst = x[:, src_positions], x[:, dst_positions]
+        unm = src.gather(-2, unm_idx.unsqueeze(-1).expand(-1, -1, channels))
+        src = src.gather(-2, src_idx.unsqueeze(-1).expand(-1, -1, channels))
+        dst = dst.scatter_reduce(-2, dst_idx.unsqueeze(-1).expand(-1, -1, channels), src, reduce="mean")
+        return torch.cat([unm, dst], dim=1)
+
+    def unmerge(x: torch.Tensor) -> torch.Tensor:
+        channels = x.shape[-1]
+        unm, dst = x[:, :unm_idx.shape[1]], x[:, unm_idx.shape[1]:]
+        src = dst.gather(-2, dst_idx.unsqueeze(-1).expand(-1, -1, channels))
+        out_src = torch.zeros(batch_size, len(src_positions), channels, device=x.device, dtype=x.dtype)
+        out_src.scatter_(-2, unm_idx.unsqueeze(-1).expand(-1, -1, channels), unm)
+        out_src.scatter_(-2, src_idx.unsqueeze(-1).expand(-1, -1, channels), src)
+        out = torch.zeros(batch_size, num_tokens, channels, device=x.device, dtype=x.dtype)
+        out[:, dst_positions] = dst
+        out[:, src_positions] = out_src
+        return out
+
+    return merge, unmerge
+
+
+class TokenMergingAttnProcessor:
+    """
+    Self-attention processor that merges similar tokens before attention and unmerges the output (ToMe).
+
+    Attention cost is quadratic in the number of tokens, so merging half of the 4096 tokens at the 64x64
+    latent resolution cuts that layer's attention work by about 4x. Layers with fewer than `min_tokens`
+    tokens, non-square token grids and cross-attention are passed straight to the wrapped processor.
+    """
+
+    def __init__(self, processor, ratio: float, min_tokens: int = 4096):
+        self.processor = processor
+        self.ratio = ratio
+        self.min_tokens = min_tokens
+
+    def __call__(self, attn, hidden_states, encoder_hidden_states=None, attention_mask=None, **kwargs):
+        num_tokens = hidden_states.shape[1] if hidden_states.ndim == 3 else 0
+        if (
+            encoder_hidden_states is not None or attention_mask is not None or num_tokens < self.min_tokens
+            or math.isqrt(num_tokens) ** 2 != num_tokens
+        ):
+            return self.processor(attn, hidden_states, encoder_hidden_states, attention_mask, **kwargs)
+
+        merge, unmerge = bipartite_soft_matching(hidden_states, self.ratio)
+        return unmerge(self.processor(attn, merge(hidden_states), None, None, **kwargs))
+
+
+def apply_attention_acceleration(unet, config):
+    """
+    Install the attention processors selected by a StableDiffusionConfig on a UNet2DConditionModel.
+
+    Processor choice is applied first, then attention slicing (which replaces it with diffusers'
+    sliced processor), then token merging, which wraps whatever self-attention processor is installed.
+    With the defaults the UNet is left untouched.
+    """
+    if config.attention_processor == "sdpa":
+        unet.set_attn_processor(AttnProcessor2_0())
+    elif config.attention_processor == "eager":
+        unet.set_attn_processor(AttnProcessor())
+
+    if config.attention_slice_size is not None:
+        unet.set_attention_slice(config.attention_slice_size)
+
+    if config.token_merge_ratio > 0:
+        # Cross-attention (attn2) attends to the 77 text tokens; only self-attention (attn1) is quadratic in latent tokens
+        unet.set_attn_processor({
+            name: TokenMergingAttnProcessor(processor, config.token_merge_ratio, config.token_merge_min_tokens)
+            if name.endswith("attn1.processor") else processor
+            for name, processor in unet.attn_processors.items()
+        })
+
+    logger.info(
+        "UNet attention: processor=%s, slice_size=%s, token_merge_ratio=%.2f",
+        config.attention_processor or "default", config.attention_slice_size, config.token_merge_ratio
+    )
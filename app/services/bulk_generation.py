@@ -0,0 +1,81 @@
+import json
+import os
+from collections import OrderedDict
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+from pydantic import ValidationError
+from app.models.pydantic_model import ImageRequest
+
+
+class BulkRequestError(Exception):
+    """Raised when a bulk request as a whole is invalid (too many items, bad output directory)."""
+
+
+async def read_ndjson_items(chunks: AsyncIterator[bytes], start_index: int, max_items: int):
+    """
+    Parse an NDJSON stream of ImageRequest objects as it arrives.
+
+    Every non-blank line gets an index, counted from 0. Lines before `start_index` are skipped
+    without being parsed so that a client can resume after a dropped connection. Per-item
+    `deadline_ms` is rejected; a bulk request has one deadline, sent in the deadline header.
+
+    Returns:
+        tuple: (items, errors) where items is a list of (index, ImageRequest) and errors a list of (index, detail).
+    """
+    items, errors = [], []
+    index = 0
+    buffer = b""
+
+    def handle_line(line: bytes):
+        nonlocal index
+        if not line.strip():
+            return
+        if index >= max_items:
+            raise BulkRequestError(f"Bulk requests are limited to {max_items} items.")
+        if index >= start_index:
+            try:
+                request = ImageRequest.parse_raw(line)
+            except (ValidationError, ValueError) as e:
+                errors.append((index, str(e)))
+            else:
+                if request.deadline_ms is not None:
+                    errors.append((index, "'deadline_ms' is not supported for bulk items; set a deadline for the whole request in the deadline header."))
+                else:
+                    items.append((index, request))
+        index += 1
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            handle_line(line)
+    handle_line(buffer)
+    return items, errors
+
+
+def batch_key(request: ImageRequest) -> Tuple[Optional[str], str]:
+    """Items with the same output settings share post-processing and can be denoised together."""
+    transformations = [transformation.dict() for transformation in request.transformations or []]
+    return request.format, json.dumps(transformations, sort_keys=True)
+
+
+def group_into_batches(items: Iterable[Tuple[int, ImageRequest]], max_batch_size: int) -> List[List[Tuple[int, ImageRequest]]]:
+    """Group items by shared settings, in order of first appearance, and split each group into batches."""
+    groups = OrderedDict()
+    for index, request in items:
+        groups.setdefault(batch_key(request), []).append((index, request))
+
+    batches = []
+    for group in groups.values():
+        for start in range(0, len(group), max_batch_size):
+            batches.append(group[start:start + max_batch_size])
+    return batches
+
+
+def resolve_output_dir(output_root: str, output_dir: str) -> str:
+    """Resolve a client-supplied output directory, refusing anything outside `output_root`."""
+    root = os.path.realpath(output_root)
+    target = os.path.realpath(os.path.join(root, output_dir))
+    if target != root and not target.startswith(root + os.sep):
+        raise BulkRequestError("Output directory must be inside the configured output root.")
+    os.makedirs(target, exist_ok=True)
+    return target
@@ -0,0 +1,55 @@
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional
+import torch
+from app.config.latent_store_config import LatentStoreConfig
+from app.utils.app_logger import logger
+
+
+class LatentStore:
+    """
+    Bounded in-memory store of final latents from earlier generations, keyed by generation ID,
+    so a later request can refine an image without denoising from pure noise again.
+    Entries are evicted least-recently-used once the entry count or byte budget is exceeded.
+    """
+
+    def __init__(self, config: LatentStoreConfig):
+        self.config = config
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, latents: torch.Tensor) -> str:
+        """
+        Store latents (moved to CPU) and return the generation ID that refers to them.
+
+        Parameters:
+            latents (torch.Tensor): Latents of one image, shaped (1, 4, H/8, W/8).
+
+        Returns:
+            str: The new generation ID.
+        """
+        latents = latents.detach().to("cpu", copy=True)
+        size = latents.element_size() * latents.nelement()
+        generation_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[generation_id] = latents
+            self._bytes += size
+            while len(self._entries) > self.config.max_entries or (self._bytes > self.config.max_bytes and len(self._entries) > 1):
+                evicted_id, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.element_size() * evicted.nelement()
+                logger.debug("Evicted latents for generation %s", evicted_id)
+        return generation_id
+
+    def get(self, generation_id: str) -> Optional[torch.Tensor]:
+        """Return the stored latents for a generation ID, or None if unknown or evicted."""
+        with self._lock:
+            latents = self._entries.get(generation_id)
+            if latents is not None:
+                self._entries.move_to_end(generation_id)
+            return latents
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -1,12 +1,20 @@
+import time
+import numpy as np
 import torch
-from transformers import CLIPTextModel, CLIPTokenizer, AutoProcessor, AutoModelForCausalLM
+from transformers import CLIPTextModel, CLIPTokenizer, AutoProcessor, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList
 from diffusers import AutoencoderKL, UNet2DConditionModel, PNDMScheduler
 from PIL import Image
 from fastapi import UploadFile
 from tqdm.auto import tqdm
+from app.services.attention_acceleration import apply_attention_acceleration
 from app.utils.app_logger import logger
 
 
+def denoising_steps(num_inference_steps: int, strength: float) -> int:
+    """Number of denoising steps a refinement at `strength` runs (at least one, at most the full schedule)."""
+    return min(max(int(num_inference_steps * strength), 1), num_inference_steps)
+
+
 class StableDiffusionModel:
     def __init__(self,config):
         
@@ -18,13 +26,16 @@ class StableDiffusionModel:
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.num_inference_steps = config.num_inference_steps
         self.guidance_scale = config.guidance_scale
-        self.generator = torch.manual_seed(config.seed)
+        # Every call draws its noise from a fresh generator with this seed, so a prompt always gives
+        # the same image regardless of earlier requests or when the model was (re)loaded
+        self.seed = config.seed
 
         logger.info("Loading models...")
         self.vae = AutoencoderKL.from_pretrained(config.vae_model, subfolder="vae").to(self.device)
         self.tokenizer = CLIPTokenizer.from_pretrained(config.tokenizer_model)
         self.text_encoder = CLIPTextModel.from_pretrained(config.text_encoder_model).to(self.device)
         self.unet = UNet2DConditionModel.from_pretrained(config.unet_model, subfolder="unet").to(self.device)
+        apply_attention_acceleration(self.unet, config)
         self.scheduler = PNDMScheduler.from_pretrained(config.scheduler_model, subfolder="scheduler")
 
 
@@ -73,18 +84,49 @@ class StableDiffusionModel:
         negative_prompt_embeds = self.text_encoder(negative_input_ids.to(self.device))[0]
         negative_prompt_embeds = negative_prompt_embeds.to(dtype=prompt_embeds_dtype, device=self.device)
         _, seq_len, _ = negative_prompt_embeds.shape
-        negative_prompt_embeds = negative_prompt_embeds.repeat(1, 1, 1).view(batch_size * 1, seq_len, -1)
+        # A single negative prompt is shared by every prompt in the batch
+        negative_repeats = batch_size if negative_prompt_embeds.shape[0] == 1 else 1
+        negative_prompt_embeds = negative_prompt_embeds.repeat(negative_repeats, 1, 1).view(batch_size * 1, seq_len, -1)
 
         concatenated_embeddings = torch.cat([negative_prompt_embeds, prompt_embeds])
         logger.info("Successfully converted prompts to embeddings")
         return concatenated_embeddings
 
-    def emb_to_latents(self, text_embeddings):
+    def pil_to_latents(self, image):
+        logger.info("Encoding image to latents...")
+        image = image.convert("RGB").resize((512, 512))
+        pixels = torch.from_numpy(np.array(image)).float() / 127.5 - 1.0
+        pixels = pixels.permute(2, 0, 1).unsqueeze(0).to(self.device, dtype=self.vae.dtype)
+        with torch.no_grad():
+            latents = self.vae.encode(pixels).latent_dist.sample(generator=torch.Generator().manual_seed(self.seed))
+        return 0.18215 * latents
+
+    def emb_to_latents(self, text_embeddings, cancellation_token=None, init_latents=None, strength=1.0):
+        """
+        Denoise latents for the given embeddings.
+
+        With `init_latents`, the latents are re-noised to the timestep `strength` of the way into the
+        schedule and only the remaining fraction of the steps is run (strength 1.0 is a full run).
+        """
         logger.info("Generating latents from embeddings...")
         self.scheduler.set_timesteps(self.num_inference_steps)
-        latents = torch.randn((1, 4, 64, 64), dtype=torch.float32).to(self.device)
-
-        for t in tqdm(self.scheduler.timesteps):
+        timesteps = self.scheduler.timesteps
+        # Embeddings hold the unconditional half followed by the conditional half of the batch
+        batch_size = text_embeddings.shape[0] // 2
+        generator = torch.Generator().manual_seed(self.seed)
+        if init_latents is None:
+            latents = torch.randn((batch_size, 4, 64, 64), generator=generator, dtype=torch.float32).to(self.device)
+        else:
+            init_steps = denoising_steps(self.num_inference_steps, strength)
+            timesteps = timesteps[(self.num_inference_steps - init_steps) * self.scheduler.order:]
+            init_latents = init_latents.to(self.device, dtype=torch.float32)
+            noise = torch.randn(init_latents.shape, generator=generator, dtype=torch.float32).to(self.device)
+            latents = self.scheduler.add_noise(init_latents, noise, timesteps[:1].repeat(batch_size))
+            logger.info("Refining latents over %d of %d steps", len(timesteps), self.num_inference_steps)
+
+        for t in tqdm(timesteps):
+            if cancellation_token is not None:
+                cancellation_token.raise_if_cancelled()
             logger.debug("Processing timestep %s", t)
             latent_model_input = torch.cat([latents] * 2)
             latent_model_input = self.scheduler.scale_model_input(latent_model_input, t)
@@ -96,14 +138,42 @@ class StableDiffusionModel:
 
         logger.info("Successfully generated latents")
         return latents
-    def generate_image(self,prompt):
+    def generate_latents(self, prompts, cancellation_token=None, init_latents=None, strength=1.0, timings=None):
+        """
+        Denoise latents for each prompt as a single batch, optionally refining `init_latents`.
+        If a `timings` dict is given, the seconds spent in the denoising loop are stored under "denoise_s".
+        """
         with torch.amp.autocast('cuda') if self.device == "cuda" else torch.no_grad():
             negative_prompts = 'deformed eyes, blurry, low quality, deformed, disfigured, extra limbs, watermark, text'#'bad anatomy, bad proportions, blurry, cloned face, cropped, deformed, dehydrated, disfigured, duplicate, error, extra arms, extra fingers, extra legs, extra limbs, fused fingers, gross proportions, jpeg artifacts, long neck, low quality, lowres, malformed limbs, missing arms, missing legs, morbid, mutated hands, mutation, mutilated, out of frame, poorly drawn face, poorly drawn hands, signature, text, too many fingers, ugly, username, watermark, worst quality'
-            text_embeddings = self.prompt_to_emb(prompt, negative_prompts)
-            latents = self.emb_to_latents(text_embeddings)
-            image = self.latents_to_pil(latents)
-            image = image[0]
-        return image
+            text_embeddings = self.prompt_to_emb(list(prompts), negative_prompts)
+            started = time.monotonic()
+            latents = self.emb_to_latents(text_embeddings, cancellation_token, init_latents, strength)
+            if timings is not None:
+                timings["denoise_s"] = time.monotonic() - started
+        # Skip the VAE decode if the request went away during the last denoising step
+        if cancellation_token is not None:
+            cancellation_token.raise_if_cancelled()
+        return latents
+
+    def generate_images(self, prompts, cancellation_token=None):
+        """Generate one image per prompt, denoising all prompts together as a single batch."""
+        latents = self.generate_latents(prompts, cancellation_token)
+        with torch.amp.autocast('cuda') if self.device == "cuda" else torch.no_grad():
+            images = self.latents_to_pil(latents)
+        return images
+
+    def generate_image(self, prompt, cancellation_token=None):
+        return self.generate_images([prompt], cancellation_token)[0]
+
+class CancellationStoppingCriteria(StoppingCriteria):
+    """Stops `generate` at the next decoding step (across all beams) once the request is cancelled."""
+
+    def __init__(self, cancellation_token):
+        self.cancellation_token = cancellation_token
+
+    def __call__(self, input_ids, scores, **kwargs):
+        cancelled = self.cancellation_token.is_cancelled
+        return torch.full((input_ids.shape[0],), cancelled, dtype=torch.bool, device=input_ids.device)
 
 class ImageCaptioningPipeline:
     def __init__(self, config):
@@ -120,11 +190,16 @@ class ImageCaptioningPipeline:
     def load_image(self, file: UploadFile):
         return Image.open(file.file)
 
-    def generate_caption_bbox(self, image, prompt="<OD>"):
-        
+    def generate_caption_bbox(self, image, prompt="<OD>", cancellation_token=None):
+        stopping_criteria = None
+        if cancellation_token is not None:
+            cancellation_token.raise_if_cancelled()
+            stopping_criteria = StoppingCriteriaList([CancellationStoppingCriteria(cancellation_token)])
 
         # Preprocess inputs
         inputs = self.processor(text=prompt, images=image, return_tensors="pt").to(self.device, self.torch_dtype)
+        if cancellation_token is not None:
+            cancellation_token.raise_if_cancelled()
 
         # Generate output
         generated_ids = self.model.generate(
@@ -132,8 +207,12 @@ class ImageCaptioningPipeline:
             pixel_values=inputs["pixel_values"],
             max_new_tokens=self.max_new_tokens,
             num_beams=self.num_beams,
-            do_sample=self.do_sample
+            do_sample=self.do_sample,
+            stopping_criteria=stopping_criteria
         )
+        # A cancelled beam search returns truncated output; don't decode it
+        if cancellation_token is not None:
+            cancellation_token.raise_if_cancelled()
         generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
 
         # Post-process the generated text
@@ -0,0 +1,215 @@
+import gc
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Dict
+import torch
+from app.config.model_residency_config import ModelResidencyConfig
+from app.utils.app_logger import logger
+
+
+def measure_footprint(model) -> int:
+    """
+    Sum the parameter and buffer bytes of every torch module held by a model wrapper.
+
+    Parameters:
+        model: A torch module, or an object such as StableDiffusionModel whose attributes are modules.
+
+    Returns:
+        int: Size in bytes, 0 if no torch modules were found.
+    """
+    modules = [model] if isinstance(model, torch.nn.Module) else [
+        value for value in getattr(model, "__dict__", {}).values() if isinstance(value, torch.nn.Module)
+    ]
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.element_size() * tensor.nelement()
+    return total
+
+
+class _ResidentModel:
+    def __init__(self, name, loader, estimated_bytes):
+        self.name = name
+        self.loader = loader
+        self.estimated_bytes = estimated_bytes
+        self.model = None
+        self.footprint_bytes = 0
+        self.in_use = False
+        self.last_used = 0.0
+        self.load_count = 0
+        # Set when unloaded for idleness; such a model is not preloaded until it is requested again
+        self.idle_evicted = False
+        # Held while the model is loading or serving a request
+        self.lock = threading.Lock()
+
+
+class ModelResidencyManager:
+    """
+    Keeps models in memory within a configured budget.
+
+    Models are loaded on first use. Before a load, least-recently-used idle models are evicted until the
+    new model's estimated footprint fits. A background sweep unloads models idle for longer than the
+    idle timeout and preloads models that make up a large share of recent requests when they fit in
+    free memory. Weights are loaded from safetensors in the Hugging Face cache, which are memory-mapped,
+    so a model reloaded after eviction is usually served from the page cache rather than from disk.
+
+    Each model serves one request at a time; the wrappers keep per-call state (e.g. scheduler timesteps).
+    """
+
+    def __init__(self, config: ModelResidencyConfig, clock=time.monotonic):
+        self.config = config
+        self.budget_bytes = int(config.memory_budget_mb * 1024 * 1024)
+        self._clock = clock
+        self._entries: Dict[str, _ResidentModel] = {}
+        self._recent = deque(maxlen=config.traffic_window)  # (time, name) of recent requests
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop_sweeper = threading.Event()
+
+    def register(self, name: str, loader: Callable[[], object]):
+        """Register a model by name with a zero-argument loader; nothing is loaded until first use."""
+        estimated_mb = self.config.footprint_estimates_mb.get(name, 0)
+        self._entries[name] = _ResidentModel(name, loader, int(estimated_mb * 1024 * 1024))
+
+    @contextmanager
+    def use(self, name: str):
+        """
+        Yield the named model, loading it first if needed. Blocks while another request is using it.
+
+        Parameters:
+            name (str): Name the model was registered under.
+        """
+        self._ensure_sweeper()
+        entry = self._entries[name]
+        with entry.lock:
+            with self._lock:
+                entry.in_use = True
+                entry.idle_evicted = False
+                self._recent.append((self._clock(), name))
+            try:
+                if entry.model is None:
+                    self._load(entry)
+                yield entry.model
+            finally:
+                with self._lock:
+                    entry.in_use = False
+                    entry.last_used = self._clock()
+
+    def _load(self, entry: _ResidentModel):
+        with self._lock:
+            self._make_room(entry.estimated_bytes, keep=entry)
+        logger.info(f"Loading model '{entry.name}'")
+        started = self._clock()
+        model = entry.loader()
+        footprint = measure_footprint(model) or entry.estimated_bytes
+        with self._lock:
+            entry.model = model
+            entry.footprint_bytes = footprint
+            entry.last_used = self._clock()
+            entry.load_count += 1
+            # The measured footprint can exceed the estimate
+            self._make_room(0, keep=entry)
+        logger.info(f"Loaded model '{entry.name}' ({footprint / 2**20:.0f} MB) in {self._clock() - started:.1f}s")
+
+    def _resident_bytes(self) -> int:
+        return sum(entry.footprint_bytes for entry in self._entries.values() if entry.model is not None)
+
+    def _make_room(self, needed_bytes: int, keep: _ResidentModel):
+        # Caller holds self._lock
+        while self._resident_bytes() + needed_bytes > self.budget_bytes:
+            candidates = [
+                entry for entry in self._entries.values()
+                if entry.model is not None and not entry.in_use and entry is not keep
+            ]
+            if not candidates:
+                logger.warning(f"Memory budget exceeded while loading '{keep.name}': all other resident models are in use")
+                return
+            self._evict(min(candidates, key=lambda entry: entry.last_used), "memory budget")
+
+    def _evict(self, entry: _ResidentModel, reason: str):
+        # Caller holds self._lock and has checked the model is not in use
+        logger.info(f"Unloading model '{entry.name}' ({reason})")
+        entry.model = None
+        entry.footprint_bytes = 0
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def evict_idle(self):
+        """Unload models that have not been used for longer than the idle timeout."""
+        now = self._clock()
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.model is not None and not entry.in_use and now - entry.last_used > self.config.idle_timeout_s:
+                    self._evict(entry, "idle timeout")
+                    entry.idle_evicted = True
+
+    def _recent_traffic(self) -> Counter:
+        # Caller holds self._lock. Only requests within the last idle timeout count, so traffic
+        # that has gone quiet does not keep a model loaded
+        since = self._clock() - self.config.idle_timeout_s
+        return Counter(name for requested, name in self._recent if requested >= since)
+
+    def preload_for_traffic(self):
+        """
+        Load models that are a large share of the requests of the last idle timeout, if they fit without
+        evicting anything. Models unloaded for idleness are left alone until they are requested again.
+        """
+        with self._lock:
+            counts = self._recent_traffic()
+            total = sum(counts.values())
+            free_bytes = self.budget_bytes - self._resident_bytes()
+            wanted = [
+                entry for name, entry in self._entries.items()
+                if entry.model is None and not entry.idle_evicted and total
+                and counts[name] / total >= self.config.preload_min_share and entry.estimated_bytes <= free_bytes
+            ]
+        for entry in wanted:
+            if not entry.lock.acquire(blocking=False):
+                continue  # Being loaded or used by a request already
+            try:
+                if entry.model is None and entry.estimated_bytes <= self.budget_bytes - self._resident_bytes():
+                    logger.info(f"Preloading model '{entry.name}' for recent traffic")
+                    self._load(entry)
+            finally:
+                entry.lock.release()
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None:
+            with self._lock:
+                if self._sweeper is None:
+                    self._sweeper = threading.Thread(target=self._sweep, name="model-residency-sweeper", daemon=True)
+                    self._sweeper.start()
+
+    def _sweep(self):
+        while not self._stop_sweeper.wait(self.config.sweep_interval_s):
+            try:
+                self.evict_idle()
+                self.preload_for_traffic()
+            except Exception as e:
+                logger.error(f"Model residency sweep failed: {str(e)}")
+
+    def stop(self):
+        """Stop the background sweep."""
+        self._stop_sweeper.set()
+
+    def stats(self) -> Dict[str, object]:
+        now = self._clock()
+        with self._lock:
+            return {
+                "budget_mb": self.budget_bytes / 2**20,
+                "resident_mb": self._resident_bytes() / 2**20,
+                "models": {
+                    name: {
+                        "resident": entry.model is not None,
+                        "in_use": entry.in_use,
+                        "footprint_mb": entry.footprint_bytes / 2**20,
+                        "idle_s": now - entry.last_used if entry.model is not None else None,
+                        "load_count": entry.load_count,
+                    }
+                    for name, entry in self._entries.items()
+                },
+                "recent_traffic": dict(self._recent_traffic()),
+            }
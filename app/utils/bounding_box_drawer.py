@@ -1,58 +1,119 @@
+from functools import lru_cache
+from xml.sax.saxutils import escape
 from PIL import Image, ImageDraw, ImageFont
 from app.utils.app_logger import logger
 
+
+@lru_cache(maxsize=None)
+def load_font(size: int = 16):
+    """
+    Load the label font once per process and size.
+
+    Parameters:
+        size (int): Font size in pixels.
+
+    Returns:
+        A PIL font, falling back to the default bitmap font if Arial is not installed.
+    """
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except IOError:
+        return ImageFont.load_default()
+
+
 class BoundingBoxDrawer:
-    def __init__(self, image, bboxes, labels):
+    def __init__(self, image, bboxes, labels, font_size=16):
         """
-        Initialize the BoundingBoxDrawer with image path, bounding boxes, and labels.
-        
+        Initialize the BoundingBoxDrawer with an image, bounding boxes, and labels.
+
         Parameters:
-            image_path (str): Path to the image file.
+            image (PIL.Image.Image): The image the boxes were detected on.
             bboxes (list): List of bounding boxes, each in the format [x_min, y_min, x_max, y_max].
             labels (list): List of labels corresponding to each bounding box.
+            font_size (int): Size of the label font.
         """
         self.image = image
         self.bboxes = bboxes
         self.labels = labels
-        self.draw = ImageDraw.Draw(self.image)
-        
-        # Attempt to load a font
-        try:
-            self.font = ImageFont.truetype("arial.ttf", 16)
-        except IOError:
-            self.font = ImageFont.load_default()
-    
-    def draw_boxes(self):
-        """
-        Draws bounding boxes and labels on the image.
-        """
+        self.font_size = font_size
+        self.font = load_font(font_size)
+
+    def _draw_annotations(self, draw, font, scale=1.0, width=3):
         for bbox, label in zip(self.bboxes, self.labels):
             # Convert bbox coordinates from float to int
-            x_min, y_min, x_max, y_max = map(int, bbox)
-            
+            x_min, y_min, x_max, y_max = (int(coordinate * scale) for coordinate in bbox)
+
             # Draw the bounding box
-            self.draw.rectangle(((x_min, y_min), (x_max, y_max)), outline="red", width=3)
-            
+            draw.rectangle(((x_min, y_min), (x_max, y_max)), outline="red", width=width)
+
             # Calculate text bounding box and position text above the bounding box
-            text_bbox = self.draw.textbbox((x_min, y_min), label, font=self.font)
+            text_bbox = draw.textbbox((x_min, y_min), label, font=font)
             text_width = text_bbox[2] - text_bbox[0]
             text_height = text_bbox[3] - text_bbox[1]
             text_x, text_y = x_min, y_min - text_height - 2  # Position 2 pixels above the box
-            
+
             # Draw a background rectangle for the text label
-            self.draw.rectangle(((text_x, text_y), (text_x + text_width, text_y + text_height)), fill="red")
-            self.draw.text((text_x, text_y), label, fill="white", font=self.font)
-            
+            draw.rectangle(((text_x, text_y), (text_x + text_width, text_y + text_height)), fill="red")
+            draw.text((text_x, text_y), label, fill="white", font=font)
+
+    def draw_boxes(self):
+        """
+        Draws bounding boxes and labels on the image.
+        """
+        self.draw = ImageDraw.Draw(self.image)
+        self._draw_annotations(self.draw, self.font)
+
+    def draw_overlay(self, max_side):
+        """
+        Draws bounding boxes and labels on a transparent layer, downscaled so its longest side is at most `max_side`.
+
+        Parameters:
+            max_side (int): Maximum width or height of the overlay.
+
+        Returns:
+            tuple: (RGBA PIL Image, scale factor from image to overlay coordinates).
+        """
+        width, height = self.image.size
+        scale = min(1.0, max_side / max(width, height))
+        overlay = Image.new("RGBA", (max(1, round(width * scale)), max(1, round(height * scale))), (0, 0, 0, 0))
+        font = load_font(max(8, round(self.font_size * scale)))
+        self._draw_annotations(ImageDraw.Draw(overlay), font, scale=scale, width=max(1, round(3 * scale)))
+        return overlay, scale
+
+    def to_svg(self):
+        """
+        Renders bounding boxes and labels as an SVG document in the image's coordinate space.
+
+        Returns:
+            str: The SVG markup.
+        """
+        width, height = self.image.size
+        elements = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        ]
+        for bbox, label in zip(self.bboxes, self.labels):
+            x_min, y_min, x_max, y_max = bbox
+            elements.append(
+                f'<rect x="{x_min:.1f}" y="{y_min:.1f}" width="{x_max - x_min:.1f}" height="{y_max - y_min:.1f}" '
+                f'fill="none" stroke="red" stroke-width="3"/>'
+            )
+            elements.append(
+                f'<text x="{x_min:.1f}" y="{y_min - 4:.1f}" fill="white" stroke="red" stroke-width="3" '
+                f'paint-order="stroke" font-family="Arial, sans-serif" font-size="{self.font_size}">{escape(label)}</text>'
+            )
+        elements.append("</svg>")
+        return "".join(elements)
+
     def show_image(self):
         """Displays the image with bounding boxes and labels."""
         self.image.show()
-    
+
     def save_image(self, output_path):
         """
         Saves the image with bounding boxes and labels to a specified path.
-        
+
         Parameters:
             output_path (str): Path to save the output image.
         """
         self.image.save(output_path)
-        logger(f"Image saved to {output_path}")
+        logger.info(f"Image saved to {output_path}")
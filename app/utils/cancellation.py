@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+from app.utils.app_logger import logger
+
+
+class RequestCancelledError(Exception):
+    """Raised from inside inference when the owning request has been cancelled."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Request cancelled: {reason}")
+        self.reason = reason
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation flag shared between a request handler and the worker thread running inference.
+
+    The handler cancels the token (client disconnect) or gives it a deadline; the worker
+    calls `raise_if_cancelled` between units of work (denoising steps, captioning stages).
+    """
+
+    DISCONNECTED = "client disconnected"
+    DEADLINE_EXCEEDED = "deadline exceeded"
+
+    def __init__(self, deadline: Optional[float] = None):
+        """
+        Parameters:
+            deadline (float, optional): Absolute `time.monotonic()` value after which the request is cancelled.
+        """
+        self.deadline = deadline
+        self._reason = None
+        self._event = threading.Event()
+
+    @classmethod
+    def from_budget_ms(cls, budget_ms: Optional[int]):
+        """Create a token whose deadline is `budget_ms` milliseconds from now (no deadline if None)."""
+        if budget_ms is None:
+            return cls()
+        return cls(deadline=time.monotonic() + budget_ms / 1000.0)
+
+    def cancel(self, reason: str):
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+            logger.info(f"Cancelling request: {reason}")
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, or None if the request has no deadline."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    @property
+    def is_cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(self.DEADLINE_EXCEEDED)
+        return self._event.is_set()
+
+    @property
+    def reason(self) -> Optional[str]:
+        return self._reason
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled:
+            raise RequestCancelledError(self._reason)
+
+
+class LatencyEstimator:
+    """
+    Tracks exponentially weighted moving averages of observed latency per operation,
+    used to refuse requests that cannot finish within their deadline.
+
+    Latency is modelled as a fixed cost (queueing, encoding, decoding) plus a cost per denoising
+    step, each averaged separately, so requests running different numbers of steps share one
+    estimate without the fixed cost being scaled along with the steps.
+
+    Nothing is refused until an operation has `min_samples` observations. Only completed requests
+    are observed, so a refused request never corrects the estimate; every `probe_interval`-th request
+    that would be refused is let through instead, re-measuring an estimate that may be stale or
+    inflated by a slow outlier.
+    """
+
+    def __init__(self, alpha: float, min_samples: int = 3, probe_interval: int = 10):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.probe_interval = probe_interval
+        self._fixed: Dict[str, float] = {}
+        self._per_step: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self._refusals: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _update(self, estimates: Dict[str, float], operation: str, seconds: float):
+        # Caller holds self._lock
+        previous = estimates.get(operation)
+        estimates[operation] = seconds if previous is None else (1 - self.alpha) * previous + self.alpha * seconds
+
+    def observe(self, operation: str, seconds: float, steps: int = 0, step_seconds: float = 0.0):
+        """
+        Record a completed request.
+
+        Parameters:
+            seconds (float): End-to-end latency.
+            steps (int): Denoising steps the request ran, 0 for operations without steps.
+            step_seconds (float): Part of `seconds` spent in those steps; the rest is fixed cost.
+        """
+        with self._lock:
+            self._update(self._fixed, operation, max(seconds - step_seconds, 0.0))
+            if steps:
+                self._update(self._per_step, operation, step_seconds / steps)
+            self._samples[operation] = self._samples.get(operation, 0) + 1
+
+    def _predict(self, operation: str, steps: int) -> Optional[float]:
+        # Caller holds self._lock
+        if self._samples.get(operation, 0) < self.min_samples:
+            return None
+        return self._fixed[operation] + steps * self._per_step.get(operation, 0.0)
+
+    def predict(self, operation: str, steps: int = 0) -> Optional[float]:
+        """
+        Predicted latency in seconds for a request running `steps` denoising steps.
+        None until the operation has been observed `min_samples` times.
+        """
+        with self._lock:
+            return self._predict(operation, steps)
+
+    def will_miss(self, operation: str, token: CancellationToken, steps: int = 0) -> bool:
+        remaining = token.remaining()
+        if remaining is None:
+            return False
+        with self._lock:
+            predicted = self._predict(operation, steps)
+            if predicted is None or predicted <= remaining:
+                return False
+            self._refusals[operation] = self._refusals.get(operation, 0) + 1
+            if self._refusals[operation] % self.probe_interval == 0:
+                logger.info(f"Admitting {operation} request predicted to miss its deadline to re-measure latency")
+                return False
+            return True
+
+
+def resolve_budget_ms(*budgets_ms: Optional[int]) -> Optional[int]:
+    """Combine deadline budgets from several sources (body field, header); the tightest one wins."""
+    budgets = [budget for budget in budgets_ms if budget is not None]
+    return min(budgets) if budgets else None
+
+
+async def watch_disconnect(request, token: CancellationToken, poll_interval_s: float):
+    """Poll the client connection and cancel `token` once the client goes away."""
+    while not token.is_cancelled:
+        if await request.is_disconnected():
+            token.cancel(CancellationToken.DISCONNECTED)
+            return
+        await asyncio.sleep(poll_interval_s)
@@ -0,0 +1,134 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+from PIL import Image
+from app.config.encoding_config import EncodingConfig
+from app.utils.app_logger import logger
+
+# Output formats the service offers; each is only enabled if the installed Pillow can write it
+CANDIDATE_FORMATS = ("PNG", "JPEG", "BMP", "WEBP", "AVIF")
+
+
+class ImageEncoder:
+    """
+    Encodes PIL images to bytes entirely in memory, optionally as several downscaled renditions
+    of one source image. Encoding runs on a dedicated thread pool; Pillow releases the GIL
+    while compressing, so renditions encode in parallel without blocking the event loop.
+    """
+
+    def __init__(self, config: EncodingConfig):
+        self.config = config
+        self._executor = ThreadPoolExecutor(max_workers=config.max_workers, thread_name_prefix="image-encoder")
+
+    @staticmethod
+    def supported_formats():
+        """
+        Return the output formats supported by the installed Pillow build.
+
+        Returns:
+            Set of format names, e.g. {"PNG", "JPEG", "BMP", "WEBP"}.
+        """
+        Image.init()
+        return {image_format for image_format in CANDIDATE_FORMATS if image_format in Image.SAVE}
+
+    @staticmethod
+    def save_options(image_format: str, quality: Optional[int] = None, progressive: bool = False, optimize: bool = False):
+        """
+        Map generic encoding settings onto the keyword arguments of `Image.save` for a format.
+
+        Parameters:
+            image_format (str): Target format name.
+            quality (int, optional): 1-100 for lossy formats; ignored by lossless ones.
+            progressive (bool): Progressive (JPEG) encoding.
+            optimize (bool): Spend more CPU for a smaller file.
+
+        Returns:
+            dict of keyword arguments for `Image.save`.
+        """
+        options = {}
+        if image_format == "JPEG":
+            options.update(progressive=progressive, optimize=optimize)
+            if quality is not None:
+                options["quality"] = quality
+        elif image_format == "PNG":
+            options["optimize"] = optimize
+        elif image_format == "WEBP":
+            options["method"] = 6 if optimize else 4
+            if quality is not None:
+                options["quality"] = quality
+        elif image_format == "AVIF":
+            options["speed"] = 4 if optimize else 8
+            if quality is not None:
+                options["quality"] = quality
+        return options
+
+    @staticmethod
+    def encode(image: Image.Image, image_format: str = "JPEG", quality: Optional[int] = None,
+               progressive: bool = False, optimize: bool = False) -> bytes:
+        """
+        Encode a PIL Image to bytes without touching the filesystem.
+
+        Parameters:
+            image (PIL.Image.Image): The image to encode.
+            image_format (str): The format to encode in (e.g. "JPEG", "PNG", "WEBP").
+            quality, progressive, optimize: See `save_options`.
+
+        Returns:
+            bytes: The encoded image.
+        """
+        image_format = image_format.upper()
+        # JPEG has no alpha channel or palette
+        if image_format == "JPEG" and image.mode not in ("RGB", "L", "CMYK"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, **ImageEncoder.save_options(image_format, quality, progressive, optimize))
+        return buffer.getvalue()
+
+    def check_renditions(self, names: Iterable[str]):
+        """Raise ValueError if any rendition name is not in the configured rendition sizes."""
+        unknown = set(names) - set(self.config.rendition_sizes)
+        if unknown:
+            raise ValueError(f"Renditions {unknown} are not supported. Supported renditions: {set(self.config.rendition_sizes)}")
+
+    def make_rendition(self, image: Image.Image, name: str) -> Image.Image:
+        """
+        Downscale the source image for a named rendition; images are never upscaled.
+
+        Parameters:
+            image (PIL.Image.Image): The decoded source image.
+            name (str): Rendition name from the configured rendition sizes.
+
+        Returns:
+            PIL Image for the rendition.
+        """
+        max_side = self.config.rendition_sizes[name]
+        if max_side is None or max(image.size) <= max_side:
+            return image
+        rendition = image.copy()
+        rendition.thumbnail((max_side, max_side), Image.LANCZOS)
+        return rendition
+
+    def encode_rendition(self, image: Image.Image, name: str, image_format: str, **options) -> Tuple[bytes, Tuple[int, int]]:
+        rendition = self.make_rendition(image, name)
+        return self.encode(rendition, image_format, **options), rendition.size
+
+    def encode_renditions(self, image: Image.Image, image_format: str, names: Iterable[str], **options) -> Dict[str, Tuple[bytes, Tuple[int, int]]]:
+        """
+        Encode several renditions of one source image on the calling thread.
+
+        Returns:
+            dict mapping rendition name to (encoded bytes, (width, height)).
+        """
+        return {name: self.encode_rendition(image, name, image_format, **options) for name in names}
+
+    async def encode_renditions_async(self, image: Image.Image, image_format: str, names: Iterable[str], **options) -> Dict[str, Tuple[bytes, Tuple[int, int]]]:
+        """Like `encode_renditions`, but encodes every rendition concurrently on the encoder thread pool."""
+        names = list(names)
+        loop = asyncio.get_running_loop()
+        encoded = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, lambda name=name: self.encode_rendition(image, name, image_format, **options))
+            for name in names
+        ])
+        logger.info(f"Encoded {len(names)} rendition(s) as {image_format}")
+        return dict(zip(names, encoded))
@@ -1,9 +1,9 @@
 from PIL import Image, ImageFilter
 import torchvision.transforms as transforms
 import torch
-import io
 import base64
 from app.utils.app_logger import logger
+from app.utils.image_encoder import ImageEncoder
 
 class ImageProcessor:
     
@@ -39,18 +39,16 @@ class ImageProcessor:
     @staticmethod
     def set_format(image: Image.Image, format: str = "PNG"):
         """
-        Save the image in a specified format.
+        Encode the image in a specified format, in memory.
         
         Parameters:
-            image: A PIL Image to save.
-            format: The desired format ('PNG', 'JPEG', 'BMP', etc.).
+            image: A PIL Image to encode.
+            format: The desired format ('PNG', 'JPEG', 'BMP', 'WEBP', etc.).
             
         Returns:
-            The saved image's file path.
+            The encoded image bytes.
         """
-        file_path = f"output_image.{format.lower()}"
-        image.save(file_path, format=format)
-        return file_path
+        return ImageEncoder.encode(image, format)
     
     @staticmethod
     def rotate_image(image: Image.Image, angle: float):
@@ -107,21 +105,23 @@ class ImageProcessor:
         return transform(image)
 
     @staticmethod
-    def convert_to_base64(image, image_format="JPEG"):
+    def convert_to_base64(image, image_format="JPEG", **options):
         """
         Converts a PIL Image to a base64-encoded string.
         
         Parameters:
             image (PIL.Image.Image): The image to be converted.
-            image_format (str): The format to save the image in (e.g., "JPEG", "PNG").
+            image_format (str): The format to save the image in (e.g., "JPEG", "PNG", "WEBP").
+            options: Encoding settings (quality, progressive, optimize) passed to ImageEncoder.encode.
         
         Returns:
             str: Base64-encoded string of the image.
         """
-        buffer = io.BytesIO()
-        image.save(buffer, format=image_format)
-        base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        return base64_image
+        return ImageProcessor.bytes_to_base64(ImageEncoder.encode(image, image_format, **options))
+
+    @staticmethod
+    def bytes_to_base64(data: bytes):
+        return base64.b64encode(data).decode("utf-8")
     
     @staticmethod
     def apply_transformation(image: Image.Image, transform_name: str, **kwargs):
@@ -0,0 +1,148 @@
+"""
+Per-step UNet benchmark for the attention acceleration options.
+
+Runs one denoising step (a classifier-free guidance batch of two) through the UNet with each
+attention configuration and reports the median step time, the speedup over the eager baseline,
+and how close the noise prediction stays to the baseline's (cosine similarity and relative error).
+
+By default a small randomly initialised UNet2DConditionModel with Stable Diffusion's latent
+shape (4x64x64, so 4096 self-attention tokens at the top level) stands in for the real model,
+which keeps a full run to well under a minute on a CPU. Pass --real to load the UNet from StableDiffusionConfig.
+
+Usage:
+    python -m benchmarks.attention_benchmark --steps 5
+    python -m benchmarks.attention_benchmark --real --steps 3 --merge-ratios 0.3 0.5
+"""
+import argparse
+import json
+import statistics
+import time
+import torch
+from diffusers import UNet2DConditionModel
+from diffusers.models.attention_processor import AttnProcessor
+from app.config.stable_diffusion_config import StableDiffusionConfig
+from app.services.attention_acceleration import apply_attention_acceleration
+
+# Shared by the stand-in's cross-attention and the random text embeddings fed to it
+STAND_IN_CROSS_ATTENTION_DIM = 64
+
+
+def build_stand_in_unet(seed=0):
+    """A two-level UNet with SD's latent shape and transformer blocks, small enough to run in a test."""
+    torch.manual_seed(seed)
+    return UNet2DConditionModel(
+        sample_size=64,
+        in_channels=4,
+        out_channels=4,
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+        cross_attention_dim=STAND_IN_CROSS_ATTENTION_DIM,
+        attention_head_dim=8,
+        norm_num_groups=16,
+    ).eval()
+
+
+def build_real_unet(config):
+    return UNet2DConditionModel.from_pretrained(config.unet_model, subfolder="unet").eval()
+
+
+def variant_configs(args):
+    """Name and StableDiffusionConfig for each attention configuration, the eager baseline first."""
+    variants = [("eager", StableDiffusionConfig(attention_processor="eager"))]
+    variants.append(("sdpa", StableDiffusionConfig(attention_processor="sdpa")))
+    variants.append((f"sliced:{args.slice_size}", StableDiffusionConfig(attention_slice_size=args.slice_size)))
+    for ratio in args.merge_ratios:
+        variants.append((f"sdpa+tome:{ratio}", StableDiffusionConfig(
+            attention_processor="sdpa", token_merge_ratio=ratio, token_merge_min_tokens=args.merge_min_tokens
+        )))
+    return variants
+
+
+def time_steps(unet, inputs, steps, warmup):
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + steps):
+            started = time.perf_counter()
+            output = unet(*inputs, return_dict=False)[0]
+            if i >= warmup:
+                timings.append(time.perf_counter() - started)
+    return statistics.median(timings), output
+
+
+def compare(output, baseline):
+    output, baseline = output.flatten().double(), baseline.flatten().double()
+    return {
+        "cosine_similarity": torch.nn.functional.cosine_similarity(output, baseline, dim=0).item(),
+        "relative_error": ((output - baseline).norm() / baseline.norm()).item(),
+    }
+
+
+def run(unet, inputs, args):
+    results = []
+    baseline_step_s, baseline_output = None, None
+    for name, config in variant_configs(args):
+        # Start every variant from the eager processors rather than the previous variant's
+        unet.set_attn_processor(AttnProcessor())
+        apply_attention_acceleration(unet, config)
+        step_s, output = time_steps(unet, inputs, args.steps, args.warmup)
+        if baseline_output is None:
+            baseline_step_s, baseline_output = step_s, output
+        results.append({"variant": name, "step_s": step_s, "speedup": baseline_step_s / step_s, **compare(output, baseline_output)})
+    return results
+
+
+def print_report(report):
+    print(f"{report['model']} UNet, median of {report['steps']} step(s)")
+    print(f"{'variant':<20}{'step':>10}{'speedup':>10}{'cosine':>10}{'rel err':>10}")
+    for result in report["results"]:
+        print(
+            f"{result['variant']:<20}{result['step_s'] * 1000:>8.0f}ms{result['speedup']:>9.2f}x"
+            f"{result['cosine_similarity']:>10.4f}{result['relative_error']:>10.4f}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--real", action="store_true", help="Benchmark the configured Stable Diffusion UNet instead of the stand-in")
+    parser.add_argument("--steps", type=int, default=5, help="Timed UNet steps per variant")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed UNet steps per variant")
+    parser.add_argument("--merge-ratios", type=float, nargs="*", default=[0.3, 0.5], help="Token merge ratios to try")
+    parser.add_argument("--merge-min-tokens", type=int, default=4096, help="Only merge in layers with at least this many tokens")
+    parser.add_argument("--slice-size", default="auto", help="Attention slice size: 'auto', 'max' or an integer")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+    if args.slice_size not in ("auto", "max"):
+        args.slice_size = int(args.slice_size)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    if args.real:
+        unet = build_real_unet(StableDiffusionConfig())
+    else:
+        unet = build_stand_in_unet(args.seed)
+    generator = torch.Generator().manual_seed(args.seed)
+    inputs = (
+        torch.randn((2, unet.config.in_channels, 64, 64), generator=generator),
+        torch.tensor(500),
+        torch.randn((2, 77, unet.config.cross_attention_dim), generator=generator),
+    )
+
+    report = {"model": "real" if args.real else "stand-in", "steps": args.steps, "results": run(unet, inputs, args)}
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
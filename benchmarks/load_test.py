@@ -0,0 +1,206 @@
+"""
+Open-loop load test for the API with stub models.
+
+Starts the FastAPI routes in-process with StableDiffusionModel and ImageCaptioningPipeline
+replaced by stubs of configurable latency, sends a Poisson stream of /generate and /caption
+requests at a target rate, and reports latency percentiles, throughput, error rate and the
+admission layer's per-class queue wait.
+
+Usage:
+    python -m benchmarks.load_test --rps 4 --duration 30 --generate-fraction 0.7 --step-ms 20
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import socket
+import threading
+import time
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from PIL import Image
+from app.api import routes
+from app.config.admission_config import AdmissionConfig, ClientPolicy
+from app.services.admission import AdmissionController, QueueWaitStats
+from app.utils.cancellation import LatencyEstimator
+from benchmarks.stub_models import StubLatencyConfig, install_stub_models
+
+
+def build_app(args):
+    install_stub_models(routes, StubLatencyConfig(
+        load_s=args.load_ms / 1000, step_s=args.step_ms / 1000, vae_s=args.vae_ms / 1000, caption_s=args.caption_ms / 1000
+    ))
+    # Load clients get generous rate limits so the test measures scheduling rather than throttling
+    api_keys = {
+        f"load-client-{i}": ClientPolicy(client_id=f"load-client-{i}", rate_per_s=args.rps * 10, burst=int(args.rps * 10) + 1)
+        for i in range(args.clients)
+    }
+    routes.admission_config = AdmissionConfig(api_keys=api_keys, max_concurrency=args.max_concurrency)
+    routes.admission_controller = AdmissionController(routes.admission_config)
+    # Drop any models loaded before the stubs were installed
+    routes.model_residency = routes.create_model_residency()
+    # Latency learned in earlier runs in this process would decide which deadlines are refused
+    routes.latency_estimator = LatencyEstimator(
+        routes.cancellation_config.latency_ewma_alpha,
+        routes.cancellation_config.min_latency_samples,
+        routes.cancellation_config.refusal_probe_interval
+    )
+
+    app = FastAPI(title="Image Verse load test")
+    app.include_router(routes.router)
+    return app
+
+
+def start_server(app):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def caption_upload():
+    buffer = io.BytesIO()
+    Image.new("RGB", (768, 512), (40, 120, 200)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+async def send_request(client, args, rng, upload):
+    endpoint = "/generate" if rng.random() < args.generate_fraction else "/caption"
+    priority = "bulk" if rng.random() < args.bulk_fraction else "interactive"
+    headers = {"X-API-Key": f"load-client-{rng.randrange(args.clients)}", "X-Priority": priority}
+    if args.deadline_ms:
+        headers["X-Request-Deadline"] = str(args.deadline_ms)
+
+    started = time.perf_counter()
+    try:
+        if endpoint == "/generate":
+            response = await client.post(endpoint, json={"prompt": "a load test prompt", "format": args.format}, headers=headers)
+        else:
+            response = await client.post(
+                endpoint, params={"render": args.caption_render}, headers=headers,
+                files={"file": ("load.jpg", upload, "image/jpeg")}
+            )
+        status_code = response.status_code
+    except httpx.HTTPError:
+        status_code = None
+    return {"endpoint": endpoint, "priority": priority, "status": status_code, "latency_s": time.perf_counter() - started}
+
+
+async def drive_load(base_url, args):
+    """Send requests at Poisson arrival times regardless of how fast earlier ones complete."""
+    rng = random.Random(args.seed)
+    upload = caption_upload()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        next_arrival = started
+        tasks = []
+        while True:
+            next_arrival += rng.expovariate(args.rps)
+            if next_arrival - started > args.duration:
+                break
+            await asyncio.sleep(max(0.0, next_arrival - loop.time()))
+            tasks.append(asyncio.create_task(send_request(client, args, rng, upload)))
+        results = await asyncio.gather(*tasks)
+        elapsed = loop.time() - started
+        admission_stats = (await client.get("/admission/stats")).json()
+    return results, elapsed, admission_stats
+
+
+def summarize(results, elapsed):
+    latencies = sorted(result["latency_s"] for result in results)
+    successes = [result for result in results if result["status"] is not None and 200 <= result["status"] < 300]
+    status_counts = {}
+    for result in results:
+        status_counts[str(result["status"])] = status_counts.get(str(result["status"]), 0) + 1
+    return {
+        "requests": len(results),
+        "throughput_rps": len(successes) / elapsed if elapsed else 0.0,
+        "error_rate": 1 - len(successes) / len(results) if results else 0.0,
+        "p50_s": QueueWaitStats.percentile(latencies, 0.50),
+        "p95_s": QueueWaitStats.percentile(latencies, 0.95),
+        "p99_s": QueueWaitStats.percentile(latencies, 0.99),
+        "status_counts": status_counts,
+    }
+
+
+def build_report(results, elapsed, admission_stats, args):
+    report = {"target_rps": args.rps, "duration_s": elapsed, "overall": summarize(results, elapsed)}
+    for key in ("endpoint", "priority"):
+        for value in sorted({result[key] for result in results}):
+            report[f"{key}:{value}"] = summarize([result for result in results if result[key] == value], elapsed)
+    report["queue_wait"] = admission_stats["queue_wait"]
+    return report
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def print_report(report):
+    print(f"Target {report['target_rps']:.2f} rps over {report['duration_s']:.1f}s")
+    print(f"{'group':<24}{'requests':>9}{'thr/s':>8}{'errors':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for group, summary in report.items():
+        if not isinstance(summary, dict) or "requests" not in summary:
+            continue
+        print(
+            f"{group:<24}{summary['requests']:>9}{summary['throughput_rps']:>8.2f}{summary['error_rate']:>8.1%}"
+            f"{format_seconds(summary['p50_s']):>9}{format_seconds(summary['p95_s']):>9}{format_seconds(summary['p99_s']):>9}"
+        )
+    print("Queue wait by priority class:")
+    for priority_class, wait in report["queue_wait"].items():
+        within_slo = "-" if wait.get("within_slo") is None else f"{wait['within_slo']:.1%}"
+        print(
+            f"  {priority_class:<12} n={wait['count']:<6} p50={format_seconds(wait['p50_s'])} "
+            f"p95={format_seconds(wait['p95_s'])} p99={format_seconds(wait['p99_s'])} within SLO={within_slo}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=2.0, help="Target request arrival rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to send requests for")
+    parser.add_argument("--generate-fraction", type=float, default=0.7, help="Share of /generate requests; the rest are /caption")
+    parser.add_argument("--bulk-fraction", type=float, default=0.0, help="Share of requests sent in the bulk priority class")
+    parser.add_argument("--clients", type=int, default=4, help="Number of distinct API clients")
+    parser.add_argument("--max-concurrency", type=int, default=1, help="Model slots in the admission layer")
+    parser.add_argument("--load-ms", type=float, default=0.0, help="Stub model construction latency")
+    parser.add_argument("--step-ms", type=float, default=20.0, help="Stub latency per denoising step")
+    parser.add_argument("--vae-ms", type=float, default=50.0, help="Stub VAE encode/decode latency")
+    parser.add_argument("--caption-ms", type=float, default=500.0, help="Stub captioning latency")
+    parser.add_argument("--format", default="JPEG", help="Output format for /generate")
+    parser.add_argument("--caption-render", default="burned", help="Render mode for /caption")
+    parser.add_argument("--deadline-ms", type=int, default=None, help="Send this X-Request-Deadline with every request")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Client-side request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server, thread, base_url = start_server(build_app(args))
+    try:
+        results, elapsed, admission_stats = asyncio.run(drive_load(base_url, args))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    report = build_report(results, elapsed, admission_stats, args)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
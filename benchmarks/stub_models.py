@@ -0,0 +1,85 @@
+import time
+import torch
+from PIL import Image
+from app.services.ml import denoising_steps
+
+
+class StubLatencyConfig:
+    def __init__(
+        self,
+        load_s: float = 0.0,
+        step_s: float = 0.02,
+        vae_s: float = 0.05,
+        caption_s: float = 0.5
+    ):
+        assert min(load_s, step_s, vae_s, caption_s) >= 0, "Stub latencies must not be negative"
+
+        self.load_s = load_s        # Per model construction
+        self.step_s = step_s        # Per denoising step
+        self.vae_s = vae_s          # Per VAE encode or decode
+        self.caption_s = caption_s  # Per caption, split over the decoding steps
+
+
+class StubStableDiffusionModel:
+    """Stand-in for StableDiffusionModel that sleeps instead of running the VAE, CLIP and UNet."""
+    latency = StubLatencyConfig()
+
+    def __init__(self, config):
+        self.num_inference_steps = config.num_inference_steps
+        time.sleep(self.latency.load_s)
+
+    def pil_to_latents(self, image):
+        time.sleep(self.latency.vae_s)
+        return torch.zeros((1, 4, 64, 64))
+
+    def latents_to_pil(self, latents):
+        time.sleep(self.latency.vae_s)
+        return [Image.new("RGB", (512, 512), (128, 96, 64)) for _ in range(latents.shape[0])]
+
+    def generate_latents(self, prompts, cancellation_token=None, init_latents=None, strength=1.0, timings=None):
+        started = time.monotonic()
+        steps = self.num_inference_steps
+        if init_latents is not None:
+            steps = denoising_steps(steps, strength)
+        for _ in range(steps):
+            if cancellation_token is not None:
+                cancellation_token.raise_if_cancelled()
+            # A batch costs the same per step as a single prompt, as on a saturated accelerator
+            time.sleep(self.latency.step_s)
+        if timings is not None:
+            timings["denoise_s"] = time.monotonic() - started
+        if cancellation_token is not None:
+            cancellation_token.raise_if_cancelled()
+        return torch.zeros((len(prompts), 4, 64, 64))
+
+    def generate_images(self, prompts, cancellation_token=None):
+        return self.latents_to_pil(self.generate_latents(prompts, cancellation_token))
+
+    def generate_image(self, prompt, cancellation_token=None):
+        return self.generate_images([prompt], cancellation_token)[0]
+
+
+class StubImageCaptioningPipeline:
+    """Stand-in for ImageCaptioningPipeline that sleeps and returns one box covering the image."""
+    latency = StubLatencyConfig()
+    decoding_steps = 10
+
+    def __init__(self, config):
+        self.config = config
+        time.sleep(self.latency.load_s)
+
+    def generate_caption_bbox(self, image, prompt="<OD>", cancellation_token=None):
+        for _ in range(self.decoding_steps):
+            if cancellation_token is not None:
+                cancellation_token.raise_if_cancelled()
+            time.sleep(self.latency.caption_s / self.decoding_steps)
+        width, height = image.size
+        return {"<OD>": {"bboxes": [[0.0, 0.0, float(width - 1), float(height - 1)]], "labels": ["object"]}}
+
+
+def install_stub_models(routes_module, latency: StubLatencyConfig):
+    """Swap the model classes used by the API routes for stubs with the given latencies."""
+    StubStableDiffusionModel.latency = latency
+    StubImageCaptioningPipeline.latency = latency
+    routes_module.StableDiffusionModel = StubStableDiffusionModel
+    routes_module.ImageCaptioningPipeline = StubImageCaptioningPipeline
@@ -0,0 +1,27 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api import routes
+from app.config.admission_config import AdmissionConfig, ClientPolicy
+from app.services.admission import AdmissionController
+from benchmarks.stub_models import StubLatencyConfig, install_stub_models
+
+STUB_API_KEY = "test-client"
+
+@pytest.fixture
+def stub_client(monkeypatch):
+    """TestClient for the API routes with stub models and one API client (burst of 3, slow refill)."""
+    for name in ("StableDiffusionModel", "ImageCaptioningPipeline", "admission_config", "admission_controller", "model_residency"):
+        monkeypatch.setattr(routes, name, getattr(routes, name))
+    install_stub_models(routes, StubLatencyConfig(step_s=0.0, vae_s=0.0, caption_s=0.0))
+    routes.admission_config = AdmissionConfig(
+        api_keys={STUB_API_KEY: ClientPolicy(client_id=STUB_API_KEY, rate_per_s=0.01, burst=3)}
+    )
+    routes.admission_controller = AdmissionController(routes.admission_config)
+    routes.model_residency = routes.create_model_residency()
+
+    app = FastAPI()
+    app.include_router(routes.router)
+    with TestClient(app, headers={"X-API-Key": STUB_API_KEY}) as client:
+        yield client
+    routes.model_residency.stop()
@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from app.config.admission_config import AdmissionConfig, ClientPolicy
+from app.services.admission import AdmissionController, QueueTimeoutError, RateLimitedError, TokenBucket, UnknownClientError
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_config(**overrides):
+    return AdmissionConfig(
+        api_keys={
+            "key-heavy": ClientPolicy(client_id="heavy", rate_per_s=100, burst=100),
+            "key-light": ClientPolicy(client_id="light", rate_per_s=100, burst=100),
+        },
+        **overrides
+    )
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_s=2, burst=2, clock=clock)
+
+    assert bucket.try_consume() == 0
+    assert bucket.try_consume() == 0
+    assert bucket.try_consume() == pytest.approx(0.5)
+
+    clock.now = 0.5
+    assert bucket.try_consume() == 0
+
+def test_identify_requires_known_key():
+    controller = AdmissionController(make_config(require_api_key=True))
+
+    assert controller.identify("key-light", "10.0.0.1").client_id == "light"
+    with pytest.raises(UnknownClientError):
+        controller.identify("bogus", "10.0.0.1")
+    with pytest.raises(UnknownClientError):
+        controller.identify(None, "10.0.0.1")
+
+def test_rate_limited_client_is_rejected():
+    controller = AdmissionController(AdmissionConfig())
+    client = controller.identify(None, "10.0.0.1")
+
+    async def admit_all():
+        for _ in range(controller.config.anonymous_policy.burst + 1):
+            async with controller.admit(client, "interactive"):
+                pass
+
+    with pytest.raises(RateLimitedError):
+        asyncio.run(admit_all())
+
+def test_fair_share_and_priority_order():
+    controller = AdmissionController(make_config())
+    heavy = controller.identify("key-heavy", None)
+    light = controller.identify("key-light", None)
+    served = []
+
+    async def request(client, priority_class, name):
+        async with controller.admit(client, priority_class):
+            served.append(name)
+            await asyncio.sleep(0)
+
+    async def scenario():
+        blocker = asyncio.create_task(request(heavy, "interactive", "blocker"))
+        await asyncio.sleep(0)
+        # The heavy client queues a backlog before the light client and the bulk job arrive
+        tasks = [asyncio.create_task(request(heavy, "interactive", f"heavy-{i}")) for i in range(3)]
+        tasks.append(asyncio.create_task(request(heavy, "bulk", "bulk-0")))
+        tasks.append(asyncio.create_task(request(light, "interactive", "light-0")))
+        await asyncio.gather(blocker, *tasks)
+
+    asyncio.run(scenario())
+
+    assert served.index("light-0") < served.index("heavy-1")
+    assert served[-1] == "bulk-0"
+    assert controller.stats()["queue_wait"]["interactive"]["count"] == 5
+
+def test_acquire_paces_work_larger_than_the_burst():
+    client = ClientPolicy(client_id="pacer", rate_per_s=100, burst=2)
+    controller = AdmissionController(AdmissionConfig(api_keys={"key-pacer": client}))
+
+    asyncio.run(controller.acquire(client, 6))
+    with pytest.raises(RateLimitedError):
+        controller.consume(client, 2)
+    # Waiting for the bucket would overrun the timeout
+    with pytest.raises(QueueTimeoutError):
+        asyncio.run(controller.acquire(client, 2, timeout=0.001))
@@ -0,0 +1,51 @@
+import torch
+from diffusers.models.attention_processor import Attention, AttnProcessor, AttnProcessor2_0
+from app.config.stable_diffusion_config import StableDiffusionConfig
+from app.services.attention_acceleration import TokenMergingAttnProcessor, apply_attention_acceleration, bipartite_soft_matching
+from benchmarks.attention_benchmark import build_stand_in_unet
+
+def test_merge_removes_tokens_and_unmerge_restores_shape():
+    tokens = torch.randn((2, 256, 32))
+    merge, unmerge = bipartite_soft_matching(tokens, 0.5)
+    merged = merge(tokens)
+
+    assert merged.shape == (2, 128, 32)
+    assert unmerge(merged).shape == tokens.shape
+    merge, unmerge = bipartite_soft_matching(tokens, 0.0)
+    assert torch.equal(unmerge(merge(tokens)), tokens)
+
+def test_token_merging_approximates_full_self_attention():
+    torch.manual_seed(0)
+    attn = Attention(query_dim=32, heads=4, dim_head=8).eval()
+    # Neighbouring tokens on a smooth grid are similar, as in image latents
+    grid = torch.linspace(0, 1, 16)
+    tokens = torch.stack(torch.meshgrid(grid, grid, indexing="ij"), dim=-1).reshape(1, 256, 2).repeat(2, 1, 16)
+
+    with torch.no_grad():
+        attn.set_processor(AttnProcessor())
+        full = attn(tokens)
+        attn.set_processor(AttnProcessor2_0())
+        sdpa = attn(tokens)
+        attn.set_processor(TokenMergingAttnProcessor(AttnProcessor2_0(), ratio=0.5, min_tokens=256))
+        merged = attn(tokens)
+        attn.set_processor(TokenMergingAttnProcessor(AttnProcessor2_0(), ratio=0.5, min_tokens=1024))
+        skipped = attn(tokens)
+
+    assert torch.allclose(sdpa, full, atol=1e-5)
+    assert torch.allclose(skipped, sdpa)
+    assert merged.shape == full.shape
+    assert torch.nn.functional.cosine_similarity(merged.flatten(), full.flatten(), dim=0) > 0.95
+
+def test_acceleration_is_opt_in_and_merges_only_self_attention():
+    unet = build_stand_in_unet()
+    unet.set_attn_processor(AttnProcessor())
+    apply_attention_acceleration(unet, StableDiffusionConfig())
+    assert all(isinstance(processor, AttnProcessor) for processor in unet.attn_processors.values())
+
+    apply_attention_acceleration(unet, StableDiffusionConfig(attention_processor="sdpa", token_merge_ratio=0.5))
+    for name, processor in unet.attn_processors.items():
+        if name.endswith("attn1.processor"):
+            assert isinstance(processor, TokenMergingAttnProcessor)
+            assert isinstance(processor.processor, AttnProcessor2_0)
+        else:
+            assert isinstance(processor, AttnProcessor2_0)
@@ -0,0 +1,28 @@
+from PIL import Image
+from app.utils.bounding_box_drawer import BoundingBoxDrawer, load_font
+
+BBOXES = [[10.0, 40.0, 300.0, 200.0], [500.0, 600.0, 900.0, 700.0]]
+LABELS = ["car", "dog & cat"]
+
+def test_font_is_loaded_once_per_size():
+    assert load_font(16) is load_font(16)
+
+def test_svg_contains_every_box_and_escapes_labels():
+    drawer = BoundingBoxDrawer(Image.new("RGB", (1024, 768)), BBOXES, LABELS)
+    svg = drawer.to_svg()
+
+    assert svg.startswith("<svg") and svg.endswith("</svg>")
+    assert svg.count("<rect") == 2
+    assert "dog &amp; cat" in svg
+
+def test_overlay_is_transparent_and_downscaled():
+    image = Image.new("RGB", (1024, 768), "blue")
+    drawer = BoundingBoxDrawer(image, BBOXES, LABELS)
+    overlay, scale = drawer.draw_overlay(512)
+
+    assert overlay.mode == "RGBA"
+    assert overlay.size == (512, 384)
+    assert scale == 0.5
+    assert overlay.getpixel((0, 0))[3] == 0
+    # The source image is left untouched
+    assert image.getpixel((20, 50)) == (0, 0, 255)
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+import pytest
+from app.api import routes
+from app.config.admission_config import AdmissionConfig, ClientPolicy
+from app.services.admission import AdmissionController
+from app.services.bulk_generation import BulkRequestError, group_into_batches, read_ndjson_items, resolve_output_dir
+from test.conftest import STUB_API_KEY
+
+def ndjson_chunks(lines, chunk_size=7):
+    # Split the body at arbitrary byte offsets, as a network stream would
+    body = "\n".join(lines).encode("utf-8")
+
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+    return chunks()
+
+def test_read_ndjson_items_resumes_from_index():
+    lines = [json.dumps({"prompt": f"prompt {i}", "format": "PNG"}) for i in range(5)]
+    lines.insert(2, "")
+    items, errors = asyncio.run(read_ndjson_items(ndjson_chunks(lines), start_index=3, max_items=100))
+
+    assert [index for index, _ in items] == [3, 4]
+    assert items[0][1].prompt == "prompt 3"
+    assert errors == []
+
+def test_read_ndjson_items_reports_invalid_lines():
+    lines = [json.dumps({"prompt": "ok", "format": "PNG"}), json.dumps({"prompt": "bad", "format": "GIF"}), "{not json"]
+    items, errors = asyncio.run(read_ndjson_items(ndjson_chunks(lines), start_index=0, max_items=100))
+
+    assert [index for index, _ in items] == [0]
+    assert [index for index, _ in errors] == [1, 2]
+
+def test_read_ndjson_items_enforces_max_items():
+    lines = [json.dumps({"prompt": f"prompt {i}", "format": "PNG"}) for i in range(3)]
+    with pytest.raises(BulkRequestError):
+        asyncio.run(read_ndjson_items(ndjson_chunks(lines), start_index=0, max_items=2))
+
+def test_group_into_batches_by_shared_settings():
+    lines = [
+        json.dumps({"prompt": "a", "format": "PNG"}),
+        json.dumps({"prompt": "b", "format": "JPEG"}),
+        json.dumps({"prompt": "c", "format": "PNG"}),
+        json.dumps({"prompt": "d", "format": "PNG"}),
+        json.dumps({"prompt": "e", "format": "PNG", "transformations": [{"name": "grayscale"}]}),
+    ]
+    items, _ = asyncio.run(read_ndjson_items(ndjson_chunks(lines), start_index=0, max_items=100))
+    batches = group_into_batches(items, max_batch_size=2)
+
+    assert [[index for index, _ in batch] for batch in batches] == [[0, 2], [3], [1], [4]]
+
+def test_resolve_output_dir_stays_inside_root(tmp_path):
+    assert resolve_output_dir(str(tmp_path), "catalog/run-1").startswith(str(tmp_path))
+    with pytest.raises(BulkRequestError):
+        resolve_output_dir(str(tmp_path), "../elsewhere")
+
+def test_read_ndjson_items_rejects_item_deadlines():
+    lines = [json.dumps({"prompt": "ok"}), json.dumps({"prompt": "late", "deadline_ms": 1000})]
+    items, errors = asyncio.run(read_ndjson_items(ndjson_chunks(lines), start_index=0, max_items=100))
+
+    assert [index for index, _ in items] == [0]
+    assert [index for index, _ in errors] == [1]
+    assert "deadline" in errors[0][1]
+
+def test_bulk_request_is_charged_per_item(stub_client):
+    # 2 tokens of burst refilled at 20 per second: 6 items need 4 more tokens, about 0.2 s of refill
+    routes.admission_config = AdmissionConfig(
+        api_keys={STUB_API_KEY: ClientPolicy(client_id=STUB_API_KEY, rate_per_s=20, burst=2)}
+    )
+    routes.admission_controller = AdmissionController(routes.admission_config)
+    body = "\n".join(json.dumps({"prompt": f"prompt {i}", "format": "PNG"}) for i in range(6))
+
+    started = time.monotonic()
+    response = stub_client.post("/generate/bulk", content=body)
+    elapsed = time.monotonic() - started
+
+    assert response.status_code == 200
+    assert [json.loads(line)["status"] for line in response.text.splitlines()] == ["success"] * 6
+    assert elapsed >= 0.15
+    # The bucket was drained by the bulk request, so an interactive request is rate limited
+    assert stub_client.post("/generate", json={"prompt": "one more"}).status_code == 429
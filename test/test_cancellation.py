@@ -0,0 +1,62 @@
+import time
+import pytest
+from app.utils.cancellation import CancellationToken, LatencyEstimator, RequestCancelledError, resolve_budget_ms
+
+def test_token_cancelled_after_deadline():
+    token = CancellationToken.from_budget_ms(10)
+    assert not token.is_cancelled
+    time.sleep(0.02)
+
+    with pytest.raises(RequestCancelledError) as error:
+        token.raise_if_cancelled()
+    assert error.value.reason == CancellationToken.DEADLINE_EXCEEDED
+
+def test_token_keeps_first_cancellation_reason():
+    token = CancellationToken()
+    token.cancel(CancellationToken.DISCONNECTED)
+    token.cancel(CancellationToken.DEADLINE_EXCEEDED)
+
+    assert token.is_cancelled
+    assert token.reason == CancellationToken.DISCONNECTED
+
+def test_estimator_predicts_deadline_miss():
+    estimator = LatencyEstimator(alpha=0.5, min_samples=2)
+    estimator.observe("generate", 10.0)
+    estimator.observe("generate", 2.0)
+
+    assert estimator.predict("generate") == pytest.approx(6.0)
+    assert estimator.will_miss("generate", CancellationToken.from_budget_ms(1000))
+    assert not estimator.will_miss("generate", CancellationToken.from_budget_ms(60000))
+    assert not estimator.will_miss("generate", CancellationToken())
+
+def test_estimator_refuses_nothing_without_data_and_probes_when_refusing():
+    estimator = LatencyEstimator(alpha=0.5, min_samples=1, probe_interval=3)
+    # No observations yet: even a tiny budget is not refused
+    assert estimator.predict("generate") is None
+    assert not estimator.will_miss("generate", CancellationToken.from_budget_ms(1))
+
+    # One slow outlier does not lock out tight deadlines: every third refusal is let through
+    estimator.observe("generate", 60.0)
+    decisions = [estimator.will_miss("generate", CancellationToken.from_budget_ms(5000)) for _ in range(6)]
+    assert decisions == [True, True, False, True, True, False]
+
+    # The probes that complete bring the estimate back down
+    for _ in range(5):
+        estimator.observe("generate", 1.0)
+    assert not estimator.will_miss("generate", CancellationToken.from_budget_ms(5000))
+
+def test_estimator_separates_fixed_and_per_step_cost():
+    estimator = LatencyEstimator(alpha=0.5, min_samples=1)
+    # Both requests cost 2 s fixed plus 0.5 s per step: a strength-0.02 refine (1 step) and a full run
+    estimator.observe("refine", 2.5, steps=1, step_seconds=0.5)
+    estimator.observe("refine", 27.0, steps=50, step_seconds=25.0)
+
+    assert estimator.predict("refine", steps=40) == pytest.approx(22.0)
+    # Scaling the 1-step sample up to a full schedule would have predicted over 100 s
+    assert not estimator.will_miss("refine", CancellationToken.from_budget_ms(30000), steps=40)
+    assert estimator.will_miss("refine", CancellationToken.from_budget_ms(10000), steps=40)
+
+def test_tightest_budget_wins():
+    assert resolve_budget_ms(None, None) is None
+    assert resolve_budget_ms(5000, None) == 5000
+    assert resolve_budget_ms(5000, 200) == 200
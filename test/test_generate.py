@@ -1,5 +1,7 @@
 from fastapi.testclient import TestClient
 from main import app  # Import the FastAPI app
+from app.api import routes
+from app.utils.cancellation import LatencyEstimator
 
 # Initialize the TestClient with the FastAPI app
 client = TestClient(app)
@@ -141,3 +143,21 @@ def test_generate_image_missing_prompt():
     response_json = response.json()
     assert response_json["detail"][0]["loc"] == ["body", "prompt"]
     assert response_json["detail"][0]["msg"] == "field required"
+
+def test_generate_image_refused_when_deadline_cannot_be_met(monkeypatch):
+    # Generation has been observed to take 30 s, far above a 1 ms budget
+    latency_estimator = LatencyEstimator(alpha=0.2, min_samples=1)
+    latency_estimator.observe("generate", 30.0)
+    monkeypatch.setattr(routes, "latency_estimator", latency_estimator)
+    payload = {
+        "prompt": "a lighthouse on a cliff during a storm",
+        "format": "JPEG",
+        "deadline_ms": 1
+    }
+
+    # Send a POST request to the /generate endpoint
+    response = client.post("/generate", json=payload)
+
+    # The request is refused before any model is loaded
+    assert response.status_code == 504
+    assert "deadline" in response.json()["detail"]
@@ -0,0 +1,58 @@
+import asyncio
+import io
+import os
+import pytest
+from PIL import Image
+from app.api import routes
+from app.config.encoding_config import EncodingConfig
+from app.utils.image_encoder import ImageEncoder
+
+encoder = ImageEncoder(EncodingConfig())
+
+def make_image(mode="RGB", size=(1024, 768)):
+    return Image.new(mode, size, "orange")
+
+def test_webp_is_supported():
+    assert {"PNG", "JPEG", "BMP", "WEBP"} <= ImageEncoder.supported_formats()
+
+def test_encode_respects_quality():
+    image = Image.effect_noise((256, 256), 64).convert("RGB")
+    low = ImageEncoder.encode(image, "JPEG", quality=20)
+    high = ImageEncoder.encode(image, "JPEG", quality=95)
+
+    assert len(low) < len(high)
+    assert Image.open(io.BytesIO(low)).format == "JPEG"
+
+def test_encode_converts_alpha_for_jpeg():
+    data = ImageEncoder.encode(make_image("RGBA"), "JPEG", progressive=True, optimize=True)
+
+    assert Image.open(io.BytesIO(data)).mode == "RGB"
+
+def test_renditions_from_one_source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    encoded = asyncio.run(encoder.encode_renditions_async(make_image(), "WEBP", ["thumbnail", "medium", "full"], quality=80))
+
+    assert {name: size for name, (_, size) in encoded.items()} == {
+        "thumbnail": (128, 96),
+        "medium": (512, 384),
+        "full": (1024, 768),
+    }
+    assert Image.open(io.BytesIO(encoded["thumbnail"][0])).format == "WEBP"
+    # Encoding never writes to the working directory
+    assert os.listdir(tmp_path) == []
+
+def test_renditions_checked_against_configured_sizes():
+    configured = ImageEncoder(EncodingConfig(rendition_sizes={"preview": 256, "full": None}))
+    configured.check_renditions(["preview", "full"])
+
+    with pytest.raises(ValueError):
+        configured.check_renditions(["thumbnail"])
+
+def test_generate_rejects_renditions_missing_from_config(stub_client, monkeypatch):
+    monkeypatch.setattr(routes, "image_encoder", ImageEncoder(EncodingConfig(rendition_sizes={"preview": 256, "full": None})))
+
+    response = stub_client.post("/generate", json={"prompt": "a red kite", "renditions": ["thumbnail"]})
+    assert response.status_code == 422
+    response = stub_client.post("/generate", json={"prompt": "a red kite", "renditions": ["preview"]})
+    assert response.status_code == 200
+    assert set(response.json()["renditions"]) == {"preview"}
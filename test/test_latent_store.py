@@ -0,0 +1,34 @@
+import torch
+from app.config.latent_store_config import LatentStoreConfig
+from app.services.latent_store import LatentStore
+
+def make_latents():
+    return torch.randn((1, 4, 64, 64), dtype=torch.float32)
+
+def test_stored_latents_round_trip():
+    store = LatentStore(LatentStoreConfig())
+    latents = make_latents()
+    generation_id = store.put(latents)
+
+    assert torch.equal(store.get(generation_id), latents)
+    assert store.get("unknown") is None
+
+def test_least_recently_used_entry_is_evicted():
+    store = LatentStore(LatentStoreConfig(max_entries=2))
+    first = store.put(make_latents())
+    second = store.put(make_latents())
+    store.get(first)
+    third = store.put(make_latents())
+
+    assert store.get(second) is None
+    assert store.get(first) is not None
+    assert store.get(third) is not None
+
+def test_byte_budget_bounds_the_store():
+    latents = make_latents()
+    entry_bytes = latents.element_size() * latents.nelement()
+    store = LatentStore(LatentStoreConfig(max_bytes=3 * entry_bytes))
+    for _ in range(5):
+        store.put(make_latents())
+
+    assert len(store) == 3
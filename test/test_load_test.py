@@ -0,0 +1,35 @@
+from app.api import routes
+from benchmarks.load_test import main
+
+HARNESS_GLOBALS = (
+    "StableDiffusionModel", "ImageCaptioningPipeline", "admission_config", "admission_controller", "model_residency", "latency_estimator"
+)
+
+def test_load_test_with_stub_models(monkeypatch):
+    # The harness swaps models and admission settings on the routes module; restore them afterwards
+    for name in HARNESS_GLOBALS:
+        monkeypatch.setattr(routes, name, getattr(routes, name))
+
+    report = main([
+        "--rps", "5", "--duration", "1", "--step-ms", "1", "--vae-ms", "1", "--caption-ms", "10",
+        "--bulk-fraction", "0.5", "--caption-render", "none",
+    ])
+
+    assert report["overall"]["requests"] > 0
+    assert report["overall"]["error_rate"] == 0
+    assert report["queue_wait"]["interactive"]["count"] + report["queue_wait"]["bulk"]["count"] == report["overall"]["requests"]
+
+def test_load_test_with_deadlines_meets_them(monkeypatch):
+    for name in HARNESS_GLOBALS:
+        monkeypatch.setattr(routes, name, getattr(routes, name))
+    # Latency learned before the run must not decide which requests are refused
+    for _ in range(routes.cancellation_config.min_latency_samples):
+        routes.latency_estimator.observe("generate", 60.0)
+
+    report = main([
+        "--rps", "5", "--duration", "1", "--step-ms", "1", "--vae-ms", "1", "--caption-ms", "10",
+        "--caption-render", "none", "--deadline-ms", "5000",
+    ])
+
+    assert report["overall"]["requests"] > 0
+    assert report["overall"]["error_rate"] == 0
@@ -0,0 +1,98 @@
+import torch
+from app.config.model_residency_config import ModelResidencyConfig
+from app.services.model_residency import ModelResidencyManager, measure_footprint
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_manager(clock, **overrides):
+    config = ModelResidencyConfig(
+        memory_budget_mb=overrides.pop("memory_budget_mb", 100),
+        footprint_estimates_mb={"a": 60, "b": 60, "c": 30},
+        **overrides
+    )
+    manager = ModelResidencyManager(config, clock=clock)
+    loads = []
+    for name in ("a", "b", "c"):
+        manager.register(name, lambda name=name: loads.append(name) or object())
+    return manager, loads
+
+def resident(manager):
+    return {name for name, model in manager.stats()["models"].items() if model["resident"]}
+
+def test_models_load_on_demand_and_stay_resident():
+    manager, loads = make_manager(FakeClock())
+    with manager.use("a") as first:
+        pass
+    with manager.use("a") as second:
+        pass
+
+    assert first is second
+    assert loads == ["a"]
+    manager.stop()
+
+def test_least_recently_used_model_is_evicted_to_fit_budget():
+    clock = FakeClock()
+    manager, loads = make_manager(clock)
+    with manager.use("a"):
+        pass
+    clock.now = 1
+    with manager.use("c"):
+        pass
+    clock.now = 2
+    with manager.use("b"):
+        pass
+
+    assert resident(manager) == {"b", "c"}
+    manager.stop()
+
+def test_idle_models_are_unloaded_and_stay_unloaded():
+    clock = FakeClock()
+    manager, loads = make_manager(clock, idle_timeout_s=10, memory_budget_mb=200)
+    for _ in range(3):
+        with manager.use("a"):
+            pass
+    with manager.use("c"):
+        pass
+
+    # Successive sweeps over an idle period must not reload what they unloaded
+    for now in (11, 21, 31, 41):
+        clock.now = now
+        manager.evict_idle()
+        manager.preload_for_traffic()
+        assert resident(manager) == set()
+    assert loads == ["a", "c"]
+    manager.stop()
+
+def test_popular_model_evicted_for_memory_is_preloaded():
+    clock = FakeClock()
+    manager, loads = make_manager(clock, idle_timeout_s=10)
+    for now, name in ((0, "c"), (1, "c"), (2, "a"), (3, "b")):
+        clock.now = now
+        with manager.use(name):
+            pass
+    # Loading b evicted both a and c; c is half of the recent requests and fits in the free memory
+    assert resident(manager) == {"b"}
+
+    clock.now = 4
+    manager.preload_for_traffic()
+    assert resident(manager) == {"b", "c"}
+
+    # Once the traffic is older than the idle timeout it no longer counts
+    clock.now = 20
+    manager.evict_idle()
+    manager.preload_for_traffic()
+    assert resident(manager) == set()
+    manager.stop()
+
+def test_measure_footprint_counts_wrapped_modules():
+    class Wrapper:
+        def __init__(self):
+            self.encoder = torch.nn.Linear(10, 10)
+            self.name = "wrapper"
+
+    assert measure_footprint(Wrapper()) == (10 * 10 + 10) * 4
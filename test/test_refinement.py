@@ -0,0 +1,92 @@
+import io
+import json
+import torch
+from diffusers import PNDMScheduler
+from PIL import Image
+from app.services.ml import StableDiffusionModel, denoising_steps
+
+class RecordingUNet:
+    """Stands in for the UNet: predicts zero noise and counts the denoising steps."""
+
+    def __init__(self):
+        self.timesteps = []
+
+    def __call__(self, latent_model_input, t, **kwargs):
+        self.timesteps.append(int(t))
+        return (torch.zeros_like(latent_model_input),)
+
+def make_model(num_inference_steps=10):
+    model = StableDiffusionModel.__new__(StableDiffusionModel)
+    model.device = "cpu"
+    model.num_inference_steps = num_inference_steps
+    model.guidance_scale = 7.5
+    model.seed = 64
+    model.unet = RecordingUNet()
+    model.scheduler = PNDMScheduler(
+        beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear",
+        skip_prk_steps=True, set_alpha_to_one=False, steps_offset=1
+    )
+    return model
+
+def test_denoising_steps_bounds():
+    assert denoising_steps(50, 1.0) == 50
+    assert denoising_steps(50, 0.5) == 25
+    assert denoising_steps(50, 0.001) == 1
+
+def test_refinement_runs_the_tail_of_the_schedule(monkeypatch):
+    model = make_model()
+    text_embeddings = torch.zeros((2, 77, 8))
+    model.emb_to_latents(text_embeddings)
+    full_schedule = model.unet.timesteps
+
+    noised_at = []
+    add_noise = model.scheduler.add_noise
+    def recording_add_noise(original, noise, timesteps):
+        noised_at.extend(int(t) for t in timesteps)
+        return add_noise(original, noise, timesteps)
+    monkeypatch.setattr(model.scheduler, "add_noise", recording_add_noise)
+
+    model.unet = RecordingUNet()
+    latents = model.emb_to_latents(text_embeddings, init_latents=torch.zeros((1, 4, 64, 64)), strength=0.3)
+
+    skipped = (model.num_inference_steps - denoising_steps(model.num_inference_steps, 0.3)) * model.scheduler.order
+    assert model.unet.timesteps == full_schedule[skipped:]
+    # The initial latents are re-noised to the first timestep that is run
+    assert noised_at == [full_schedule[skipped]]
+    assert latents.shape == (1, 4, 64, 64)
+
+def test_generation_does_not_depend_on_earlier_requests():
+    model = make_model()
+    text_embeddings = torch.zeros((2, 77, 8))
+    first = model.emb_to_latents(text_embeddings)
+    # Other requests (or other libraries) consuming the global RNG in between
+    torch.rand(1000)
+    second = model.emb_to_latents(text_embeddings)
+
+    assert torch.equal(first, second)
+
+def test_refine_unknown_generation_is_not_found(stub_client):
+    response = stub_client.post("/generate/refine", json={"prompt": "a blue kite", "generation_id": "unknown"})
+    assert response.status_code == 404
+
+def test_refine_earlier_generation(stub_client):
+    generation_id = stub_client.post("/generate", json={"prompt": "a red kite"}).json()["generation_id"]
+    response = stub_client.post("/generate/refine", json={"prompt": "a blue kite", "generation_id": generation_id, "strength": 0.4})
+
+    assert response.status_code == 200
+    assert response.json()["generation_id"] != generation_id
+
+def test_refine_upload_without_format(stub_client):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "teal").save(buffer, format="PNG")
+    files = {"file": ("kite.png", buffer.getvalue(), "image/png")}
+
+    response = stub_client.post("/generate/refine/upload", data={"prompt": "a green kite"}, files=files)
+    assert response.status_code == 200
+    assert response.json()["image_format"] == "PNG"
+
+def test_bulk_item_with_null_format_is_generated(stub_client):
+    response = stub_client.post("/generate/bulk", content=json.dumps({"prompt": "a kite", "format": None}))
+
+    assert response.status_code == 200
+    assert json.loads(response.text)["status"] == "success"